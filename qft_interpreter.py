@@ -10,38 +10,94 @@ from tkinter import messagebox
 from tkinter import filedialog
 import sys
 import os
+from pathlib import Path # For the read-only DB URI
 from datetime import datetime, timedelta # Added timedelta for dashboard default range
 import logging
+import logging.handlers # For the queued batch-warning logger
 import sqlite3 # Built-in database library
 import csv     # Built-in CSV handling
+import io # For parsing log blocks read backwards
 import json    # For configuration
 import time    # For barcode timing simulation
 import platform # For system info
 import traceback # For detailed error logging
-from collections import Counter # For counting indeterminate reasons
+import itertools # For chunked batch reading
+import re # For sanitizing sample IDs in export filenames
+import zipfile # For streaming batch .xlsx sheets
+import posixpath # For resolving part names inside .xlsx archives
+import xml.etree.ElementTree as ET # For streaming batch .xlsx sheets
+import queue # For handing worker results back to the Tk thread
+from concurrent.futures import ThreadPoolExecutor # For running batch work off the Tk thread
+import threading # For the shared DB connection lock
+import atexit # For closing the shared DB connection
+import importlib.util # For locating optional libraries without importing them
+from collections import Counter, deque # For counting indeterminate reasons / the item window of paged Treeviews
+from operator import itemgetter # For pulling the value columns out of batch rows
+from contextlib import contextmanager, nullcontext # For the DB transaction helper / optional report snapshots
+from functools import lru_cache # For memoizing batch header layouts
 
 # --- Required External Libraries ---
-# Try importing optional libraries for export/display features
-try:
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage, PageBreak, KeepTogether
+# Optional libraries for export/display features are only located here; _import_reportlab/_import_openpyxl/_import_xlsxwriter/_import_pil
+# import them on first use so they do not slow down application start-up.
+REPORTLAB_AVAILABLE = importlib.util.find_spec("reportlab") is not None
+if not REPORTLAB_AVAILABLE: print("Warning: reportlab not found. PDF export disabled.", file=sys.stderr)
+OPENPYXL_AVAILABLE = importlib.util.find_spec("openpyxl") is not None
+if not OPENPYXL_AVAILABLE: print("Warning: openpyxl not found. Excel import/export disabled.", file=sys.stderr)
+XLSXWRITER_AVAILABLE = importlib.util.find_spec("xlsxwriter") is not None
+if not XLSXWRITER_AVAILABLE: print("Warning: xlsxwriter not found. Batch/summary Excel exports will use openpyxl.", file=sys.stderr)
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+if not PIL_AVAILABLE: print("Warning: Pillow (PIL) not found. Flowchart display disabled.", file=sys.stderr)
+
+def _result_code(result):
+    """Canonicalizes a result string ("POS†", "NEG", "IND*", ...) to its 3-letter code, or "ERR" if it is not a known result."""
+    code = result[:3]
+    return code if code in RESULT_CODES else "ERR"
+
+def _import_reportlab():
+    """Imports the ReportLab names used by the PDF exports into module globals (cheap after the first call)."""
+    global SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, RLImage, PageBreak, getSampleStyleSheet, ParagraphStyle, inch, colors, TA_LEFT, TA_CENTER, TA_RIGHT, stringWidth
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage, PageBreak
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
     from reportlab.lib.units import inch
     from reportlab.lib import colors
     from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT # For alignment constants
-    REPORTLAB_AVAILABLE = True
-except ImportError: REPORTLAB_AVAILABLE = False; print("Warning: reportlab not found. PDF export disabled.", file=sys.stderr)
+    from reportlab.pdfbase.pdfmetrics import stringWidth
 
-try:
+def _import_openpyxl():
+    """Imports the openpyxl names used by Excel import/export into module globals (cheap after the first call)."""
+    global Workbook, load_workbook, Font, Alignment, Border, Side, PatternFill, NamedStyle, DEFAULT_FONT, get_column_letter, WriteOnlyCell, BUILTIN_FORMATS, is_date_format, is_timedelta_format, range_boundaries, from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
     from openpyxl import Workbook, load_workbook
-    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-    from openpyxl.utils import get_column_letter
-    OPENPYXL_AVAILABLE = True
-except ImportError: OPENPYXL_AVAILABLE = False; print("Warning: openpyxl not found. Excel import/export disabled.", file=sys.stderr)
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+    from openpyxl.styles.fonts import DEFAULT_FONT
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+    from openpyxl.utils import get_column_letter, range_boundaries
+    from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+    from openpyxl.cell import WriteOnlyCell
+
+def _import_xlsxwriter():
+    """Imports xlsxwriter into module globals (cheap after the first call)."""
+    global xlsxwriter
+    import xlsxwriter
+
+def _import_pil():
+    """Imports Pillow's Image/ImageTk into module globals (cheap after the first call)."""
+    global Image, ImageTk
+    from PIL import Image, ImageTk
 
 try:
-    from PIL import Image, ImageTk
-    PIL_AVAILABLE = True
-except ImportError: PIL_AVAILABLE = False; print("Warning: Pillow (PIL) not found. Flowchart display disabled.", file=sys.stderr)
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError: NUMPY_AVAILABLE = False; print("Warning: numpy not found. Batch interpretation will not be vectorized.", file=sys.stderr)
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = NUMPY_AVAILABLE
+except ImportError: NUMBA_AVAILABLE = False; print("Warning: numba not found. Batch classification will use NumPy only.", file=sys.stderr)
+
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = NUMPY_AVAILABLE
+except ImportError: PANDAS_AVAILABLE = False; print("Warning: pandas not found. Batch CSV files will be parsed with the csv module.", file=sys.stderr)
 
 
 # --- Constants ---
@@ -53,12 +109,72 @@ LOG_FILENAME = os.path.join(SCRIPT_DIR, "qft_interpreter_log.csv")
 DB_FILENAME = os.path.join(SCRIPT_DIR, "qft_history.db")
 CONFIG_FILENAME = os.path.join(SCRIPT_DIR, "qft_config.json")
 
-REQUIRED_BATCH_HEADERS = {'sample id', 'nil', 'tb1', 'tb2', 'mitogen'}
+BATCH_HEADER_ORDER = ('sample id', 'nil', 'tb1', 'tb2', 'mitogen') # Order of the column indices returned by _parse_header
+REQUIRED_BATCH_HEADERS = frozenset(BATCH_HEADER_ORDER)
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"; XLSX_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id" # SpreadsheetML tag namespace / r:id attribute, for _stream_xlsx_rows
+XLSX_WORKSHEET_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+BATCH_CHUNK_SIZE = 4096; CSV_READ_BUFFER = 1 << 16 # Batch rows interpreted per vectorized pass / read buffer for batch CSV files
 LOG_HEADER = ["Timestamp", "OperatorID", "RunID", "SampleID", "Nil", "TB1", "TB2", "Mitogen", "Result", "Reason"]
-DEFAULT_CONFIG = {"geometry": "700x750", "theme": "clam", "dashboard_days": 7}
-CONFIG_KEYS = {"geometry", "theme", "dashboard_days"}
+DEFAULT_CONFIG = {"geometry": "700x750", "theme": "clam", "dashboard_days": 7, "fast_xlsx_import": False} # fast_xlsx_import: opt in to _stream_xlsx_rows for batch .xlsx files (openpyxl otherwise)
+CONFIG_KEYS = {"geometry", "theme", "dashboard_days", "fast_xlsx_import"}
+DB_PRAGMAS = ("PRAGMA synchronous=NORMAL", "PRAGMA temp_store=MEMORY", "PRAGMA cache_size=-20000", "PRAGMA mmap_size=268435456", "PRAGMA analysis_limit=1000") # Applied on every connection (WAL is persisted in the DB file by init_db; analysis_limit bounds ANALYZE / PRAGMA optimize to a sample of each index)
+DB_STATEMENT_CACHE = 256 # Per-connection prepared statement cache; the hot queries below stay compiled on the shared connection
+DB_INSERT_CHUNK = 10000 # Rows per executemany() call in bulk saves; saves at least this large also refresh the planner statistics (ANALYZE)
+DB_BULK_SUMMARY_ROWS = 1000 # Saves at least this large update daily_summary with one grouped upsert instead of the per-row insert trigger
+DB_SHUTDOWN_VACUUM_PAGES = 200 # Free pages handed back to the OS on each shutdown (DBs created with auto_vacuum=INCREMENTAL; a no-op for older files)
+SQL_INSERT_INTERPRETATION = "INSERT INTO interpretations (timestamp, operator_id, sample_id, run_id, nil_value, tb1_value, tb2_value, mit_value, result, reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_SELECT_PREVIOUS = "SELECT result, timestamp FROM interpretations WHERE sample_id = ? ORDER BY timestamp DESC LIMIT 1"
+SQL_SELECT_REPORT_RANGE = "SELECT timestamp, operator_id, run_id, sample_id, result, reason FROM interpretations WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp ASC"
+SQL_IND_BUCKET = "CASE WHEN {0}result IS NOT 'IND*' THEN '' WHEN instr({0}reason, 'High Nil') > 0 THEN 'High Nil' WHEN instr({0}reason, 'Low Mitogen') > 0 THEN 'Low Mitogen' ELSE 'Other' END" # IND reason bucket of a row ('' for non-IND, including NULL results); {0} is the row prefix ('' or 'NEW.'/'OLD.' in triggers)
+SQL_CREATE_DAILY_SUMMARY = "CREATE TABLE daily_summary (day TEXT NOT NULL, result TEXT NOT NULL, ind_bucket TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (day, result, ind_bucket)) WITHOUT ROWID" # Per-day result counts, maintained by the triggers below
+SQL_DAILY_SUMMARY_ADD = f"INSERT INTO daily_summary (day, result, ind_bucket, count) VALUES (substr(NEW.timestamp, 1, 10), COALESCE(NEW.result, ''), {SQL_IND_BUCKET.format('NEW.')}, 1) ON CONFLICT (day, result, ind_bucket) DO UPDATE SET count = count + 1;" # Counts a NEW row / uncounts an OLD row (trigger bodies)
+SQL_DAILY_SUMMARY_SUB = f"UPDATE daily_summary SET count = count - 1 WHERE day = substr(OLD.timestamp, 1, 10) AND result = COALESCE(OLD.result, '') AND ind_bucket = {SQL_IND_BUCKET.format('OLD.')};"
+DAILY_SUMMARY_TRIGGER_NAMES = ("trg_daily_summary_insert", "trg_daily_summary_delete", "trg_daily_summary_update")
+SQL_DAILY_SUMMARY_INSERT_TRIGGER = f"CREATE TRIGGER IF NOT EXISTS trg_daily_summary_insert AFTER INSERT ON interpretations BEGIN {SQL_DAILY_SUMMARY_ADD} END" # Dropped for the duration of large bulk saves (see SQL_FOLD_DAILY_SUMMARY)
+SQL_DAILY_SUMMARY_TRIGGERS = (SQL_DAILY_SUMMARY_INSERT_TRIGGER,
+                              f"CREATE TRIGGER IF NOT EXISTS trg_daily_summary_delete AFTER DELETE ON interpretations BEGIN {SQL_DAILY_SUMMARY_SUB} END",
+                              f"CREATE TRIGGER IF NOT EXISTS trg_daily_summary_update AFTER UPDATE OF timestamp, result, reason ON interpretations BEGIN {SQL_DAILY_SUMMARY_SUB} {SQL_DAILY_SUMMARY_ADD} END")
+DB_SCHEMA_VERSION = 2 # PRAGMA user_version of an up-to-date history DB; older files get daily_summary and its triggers rebuilt by init_db (2: NULL results no longer bucketed as IND, UPDATE trigger)
+SQL_BACKFILL_DAILY_SUMMARY = f"INSERT INTO daily_summary (day, result, ind_bucket, count) SELECT substr(timestamp, 1, 10), COALESCE(result, ''), {SQL_IND_BUCKET.format('')} AS ind_bucket, COUNT(*) FROM interpretations GROUP BY 1, 2, 3" # One-off fill for histories that predate daily_summary
+SQL_FOLD_DAILY_SUMMARY = f"INSERT INTO daily_summary (day, result, ind_bucket, count) SELECT substr(timestamp, 1, 10), COALESCE(result, ''), {SQL_IND_BUCKET.format('')} AS ind_bucket, COUNT(*) FROM interpretations WHERE id > ? GROUP BY 1, 2, 3 ON CONFLICT (day, result, ind_bucket) DO UPDATE SET count = count + excluded.count" # Counts the rows of a bulk save (ids above the given one) with one grouped upsert
+SQL_DASHBOARD_COUNTS = "SELECT result, ind_bucket, SUM(count) FROM daily_summary WHERE day BETWEEN ? AND ? GROUP BY result, ind_bucket" # Reads the pre-aggregated days, not the raw rows
+SQL_REPORT_DISTINCT = "SELECT COUNT(DISTINCT NULLIF(run_id, '')), COUNT(DISTINCT NULLIF(operator_id, '')) FROM interpretations WHERE timestamp BETWEEN ? AND ?" # Unique run/operator counts (blank IDs excluded)
+
+BATCH_EXCEL_HEADERS = ("Sample ID", "Operator", "Nil", "TB1", "TB2", "Mitogen", "Result", "Reason", "Nil-25%", "TB1-Nil", "TB2-Nil", "Mit-Nil"); BATCH_EXCEL_COLUMN_WIDTHS = (20, 12, 10, 10, 10, 10, 10, 45, 10, 10, 10, 10) # Batch Excel export columns
+SUMMARY_METRIC_HEADERS = ("Metric", "Count / Value"); SUMMARY_DETAIL_HEADERS = ("Timestamp", "Operator", "Run ID", "Sample ID", "Result", "Reason") # Summary report metric table (PDF and Excel) / Excel detail sheet headers
+BATCH_PDF_TABLE_ROWS = 100 # Data rows per batch PDF table (each repeats the header); keeps ReportLab's table splitting cheap on large batches
+LOG_WRITE_BUFFER = 1 << 16 # Write buffer for the persistent CSV log handle
+LOG_TAIL_BLOCK = 1 << 16 # Bytes read per step when the log viewer reads the log backwards
+HISTORY_PAGE_SIZE = 500 # Rows per history window page ("Load More" fetches the next one, keyed on the last row shown)
+HISTORY_VIEW_COLUMNS = (("timestamp", "Timestamp", 140, tk.W), ("operator", "Operator", 70, tk.W), ("run_id", "Run ID", 100, tk.W), ("sample_id", "Sample ID", 120, tk.W), ("nil", "Nil", 60, tk.E), ("tb1", "TB1", 60, tk.E), ("tb2", "TB2", 60, tk.E), ("mit", "Mitogen", 60, tk.E), ("result", "Result", 70, tk.W), ("reason", "Reason", 250, tk.W)) # (id, heading, width, anchor); the last column stretches
+BATCH_VIEW_COLUMNS = (("sample_id", "Sample ID", 150, tk.W), ("nil", "Nil", 70, tk.E), ("tb1", "TB1", 70, tk.E), ("tb2", "TB2", 70, tk.E), ("mit", "Mitogen", 70, tk.E), ("result", "Result", 80, tk.W), ("reason", "Reason", 400, tk.W))
+LOG_VIEW_COLUMNS = tuple((h.lower().replace(' ', '_'), h, w, a) for h, w, a in zip(LOG_HEADER, (140, 70, 100, 120, 60, 60, 60, 60, 70, 300), (tk.W,) * 4 + (tk.E,) * 4 + (tk.W,) * 2))
+RESULT_EXCEL_COLUMN_WIDTHS = {'A': 22, 'B': 18, 'C': 18, 'D': 18}; SUMMARY_EXCEL_COLUMN_WIDTHS = {'A': 30, 'B': 15}; SUMMARY_DETAIL_COLUMN_WIDTHS = {'A': 20, 'B': 15, 'C': 15, 'D': 20, 'E': 10, 'F': 50} # Excel export column widths, by column letter
+TREEVIEW_INSERT_PROC_NAME = "qft_treeview_insert"; TREEVIEW_INSERT_PROC = f"proc {TREEVIEW_INSERT_PROC_NAME} {{tv rows}} {{set ids {{}}; foreach values $rows {{lappend ids [$tv insert {{}} end -values $values]}}; return $ids}}" # Tcl helper for _treeview_insert_rows
+TREEVIEW_RECYCLE_PROC_NAME = "qft_treeview_recycle"; TREEVIEW_RECYCLE_PROC = f"proc {TREEVIEW_RECYCLE_PROC_NAME} {{tv ids rows index}} {{foreach id $ids values $rows {{$tv item $id -values $values; $tv move $id {{}} $index; if {{$index ne \"end\"}} {{incr index}}}}}}" # Tcl helper for _treeview_recycle_items
+TREEVIEW_PAGE_SIZE = 500; TREEVIEW_PREFETCH = 0.9 # Rows added per page into the batch results/log viewer Treeviews / scroll position (fraction of the item window) that brings in the next page
+TREEVIEW_WINDOW_ROWS = 4 * TREEVIEW_PAGE_SIZE # Most items a paged Treeview holds; beyond that, items scrolled past are rebound to the rows coming into view
+UI_POLL_INTERVAL_MS = 100 # How often the Tk loop checks background work for progress/results (10 Hz)
+
+STYLE_SPEC = (("TLabel", {"font": ('Segoe UI', 10)}), ("TButton", {"font": ('Segoe UI', 10, 'bold'), "padding": 5}), ("TEntry", {"font": ('Segoe UI', 10), "padding": 3}), ("Header.TLabel", {"font": ('Segoe UI', 12, 'bold')}),
+              ("ResultPOS.TLabel", {"font": ('Segoe UI', 16, 'bold'), "foreground": 'red'}), ("ResultNEG.TLabel", {"font": ('Segoe UI', 16, 'bold'), "foreground": 'darkgreen'}), ("ResultIND.TLabel", {"font": ('Segoe UI', 16, 'bold'), "foreground": 'red'}), ("ResultDefault.TLabel", {"font": ('Segoe UI', 16, 'bold'), "foreground": 'black'}),
+              ("Status.TLabel", {"font": ('Segoe UI', 9), "padding": 2})) # Custom ttk styles, applied once per theme by _configure_styles
+RESULT_CODES = frozenset(("POS", "NEG", "IND")) # Canonical result codes (result string without its †/* marker)
+RESULT_LABEL_STYLES = {"POS": 'ResultPOS.TLabel', "NEG": 'ResultNEG.TLabel', "IND": 'ResultIND.TLabel'} # Result label style, keyed by _result_code
+RESULT_TEXT_TAGS = {"POS": "pos_ind_result", "IND": "pos_ind_result", "NEG": "neg_result"} # Results text highlight tag, keyed by _result_code
+PDF_RESULT_STYLES = {"POS": 'ResultPOS', "IND": 'ResultIND', "NEG": 'ResultNEG'} # PDF result paragraph style, keyed by _result_code
+RESULTS_HR_EQ = "=" * 70; RESULTS_HR_DASH = "-" * 70
+RESULTS_TEXT_TEMPLATE = (f"{RESULTS_HR_EQ}\n Sample ID: {{sample_id}} | Run ID: {{run_id}} | Operator ID: {{operator_id}}\n{RESULTS_HR_DASH}\n\n" # Main results panel text, filled by format_results_text
+                         f"{'Parameter':<15} | {'Input (IU/mL)':<15} | {'Calculated Value':<30}\n{RESULTS_HR_DASH}\n"
+                         f"{'Nil':<15} | {{input_nil:<15.3f}} | {'25% of Nil:':<14} {{nil_25:<15.4f}}\n{'TB1':<15} | {{input_tb1:<15.3f}} | {'TB1 - Nil:':<14} {{tb1_nil:<15.4f}}\n"
+                         f"{'TB2':<15} | {{input_tb2:<15.3f}} | {'TB2 - Nil:':<14} {{tb2_nil:<15.4f}}\n{'Mitogen':<15} | {{input_mit:<15.3f}} | {'Mit - Nil:':<14} {{mit_nil:<15.4f}}\n{RESULTS_HR_DASH}\n"
+                         f"{'QFT RESULT':<15} | {{result:<53}}\n{{reason_line}}{RESULTS_HR_EQ}\n"
+                         "*IND: Indeterminate; †POS: Positive; NEG: Negative\nNote: Refer to Flowchart (Help Menu). Clinical correlation required.\n")
+RESULTS_TEXT_RESULT_LINE = RESULTS_TEXT_TEMPLATE[:RESULTS_TEXT_TEMPLATE.index("QFT RESULT")].count("\n") + 1 # 1-based line of the QFT RESULT row
 
 BARCODE_INTERKEY_DELAY = 0.1; BARCODE_MIN_LEN = 3
+BARCODE_PRINTABLE_CHARS = frozenset(chr(c) for c in range(32, 127)) # Printable ASCII accepted into the barcode buffer
+SAFE_FILENAME_CHAR_RE = re.compile(r"[\W_]") # Any character that is not str.isalnum(); replaced by "_" in suggested export filenames
 SELF_TEST_CASES = [("Clear Positive (TB1)", 0.10, 1.50, 0.20, 5.0, "POS†"),("Clear Positive (TB2)", 0.20, 0.40, 2.00, 6.0, "POS†"),("Clear Negative", 0.10, 0.20, 0.30, 2.0, "NEG"),("Indeterminate (High Nil)", 9.50, 10.0, 11.0, 15.0, "IND*"),("Indeterminate (Low Mitogen)", 0.20, 0.30, 0.40, 0.60, "IND*"),("Borderline Positive (TB1 near 0.35)", 0.10, 0.45, 0.20, 3.0, "POS†"),("Borderline Negative (TB1 below 0.35)", 0.10, 0.40, 0.20, 3.0, "NEG"),("Borderline Positive (TB1 meets 25% rule)", 1.00, 1.35, 0.50, 4.0, "POS†"), ("Borderline Negative (TB1 fails 25% rule)", 1.60, 1.95, 0.50, 4.0, "NEG")]
 
 # --- Logging Setup ---
@@ -75,22 +191,72 @@ def setup_logging():
     return logger
 qft_logger = setup_logging()
 
-def log_event(event_type="INFO", op_id="System", run_id="N/A", sample_id="N/A", result="N/A", reason="N/A", details=""):
-    """Writes a structured event to the CSV log file."""
+def setup_batch_logger():
+    """Sets up the batch row-warning logger. Records go through a queue to a listener thread that writes them to stderr, so the batch loop never waits on the console."""
+    record_queue = queue.SimpleQueue(); stderr_handler = logging.StreamHandler(sys.stderr); stderr_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(record_queue, stderr_handler); listener.start(); atexit.register(listener.stop) # stop() drains pending records
+    logger = logging.getLogger('QFTBatch'); logger.setLevel(logging.INFO); logger.propagate = False # Never reaches the CSV log handler
+    if not logger.handlers: logger.addHandler(logging.handlers.QueueHandler(record_queue))
+    return logger
+batch_logger = setup_batch_logger()
+
+_log_fh = None; _log_writer = None; _log_lock = threading.Lock() # Persistent CSV log handle shared by log_event()
+
+def _get_log_writer():
+    """Returns the persistent CSV log writer, opening the log file on first use (caller holds _log_lock)."""
+    global _log_fh, _log_writer
+    if _log_writer is None: _log_fh = open(LOG_FILENAME, 'a', newline='', encoding='utf-8', buffering=LOG_WRITE_BUFFER); _log_writer = csv.writer(_log_fh)
+    return _log_writer
+
+def flush_log():
+    """Flushes buffered CSV log rows to disk."""
+    with _log_lock:
+        if _log_fh is not None:
+            try: _log_fh.flush()
+            except (IOError, ValueError) as e: print(f"Failed to flush log file: {e}", file=sys.stderr)
+
+def close_log():
+    """Flushes and closes the persistent CSV log handle (safe to call more than once)."""
+    global _log_fh, _log_writer
+    with _log_lock:
+        if _log_fh is not None:
+            try: _log_fh.close()
+            except (IOError, ValueError) as e: print(f"Failed to close log file: {e}", file=sys.stderr)
+            _log_fh = None; _log_writer = None
+atexit.register(close_log)
+
+def _format_log_value(value):
+    """Formats a numeric log value to 3 decimals; floats are formatted directly, other values parsed or passed through."""
+    if isinstance(value, (float, int)): return f"{value:.3f}"
+    if value is None or value == "": return ""
+    try: return f"{float(value):.3f}"
+    except (ValueError, TypeError): return str(value)
+
+def _build_log_row(timestamp, op_id, run_id, sample_id, result, reason, details):
+    """Builds one CSV log row (LOG_HEADERS order) from an interpretation's IDs, result and raw input values."""
+    nil_str, tb1_str, tb2_str, mit_str = map(_format_log_value, (details.get('nil'), details.get('tb1'), details.get('tb2'), details.get('mit')))
+    return [timestamp, op_id, run_id, sample_id, nil_str, tb1_str, tb2_str, mit_str, result, reason]
+
+def log_event(event_type="INFO", op_id="System", run_id="N/A", sample_id="N/A", result="N/A", reason="N/A", details="", flush=True, timestamp=None):
+    """Writes a structured event to the CSV log file. Pass flush=False to defer the flush to a later flush_log(); batches use log_interpretations_bulk()."""
     if event_type != "INTERPRET": return # Only log interpretations for now
     try:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        nil_val = details.get('nil',''); tb1_val = details.get('tb1',''); tb2_val = details.get('tb2',''); mit_val = details.get('mit','')
-        try: nil_str = f"{float(nil_val):.3f}" if nil_val else ""
-        except: nil_str = str(nil_val)
-        try: tb1_str = f"{float(tb1_val):.3f}" if tb1_val else ""
-        except: tb1_str = str(tb1_val)
-        try: tb2_str = f"{float(tb2_val):.3f}" if tb2_val else ""
-        except: tb2_str = str(tb2_val)
-        try: mit_str = f"{float(mit_val):.3f}" if mit_val else ""
-        except: mit_str = str(mit_val)
-        log_row = [timestamp, op_id, run_id, sample_id, nil_str, tb1_str, tb2_str, mit_str, result, reason]
-        with open(LOG_FILENAME, 'a', newline='', encoding='utf-8') as f: csv.writer(f).writerow(log_row)
+        if timestamp is None: timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        log_row = _build_log_row(timestamp, op_id, run_id, sample_id, result, reason, details)
+        with _log_lock:
+            _get_log_writer().writerow(log_row)
+            if flush: _log_fh.flush()
+    except Exception as e: print(f"Failed to write to log file: {e}", file=sys.stderr)
+
+def log_interpretations_bulk(results, timestamp=None, flush=True):
+    """Writes INTERPRET log rows for a list of result dictionaries with a single writerows() call. Pass flush=False to leave the rows buffered until flush_log()."""
+    if not results: return
+    try:
+        if timestamp is None: timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        log_rows = [_build_log_row(timestamp, r.get('operator_id', 'N/A'), r.get('run_id', 'N/A'), r.get('sample_id', 'N/A'), r.get('result', 'N/A'), r.get('reason', 'N/A'), {'nil': r.get('input_nil'), 'tb1': r.get('input_tb1'), 'tb2': r.get('input_tb2'), 'mit': r.get('input_mit')}) for r in results]
+        with _log_lock:
+            _get_log_writer().writerows(log_rows)
+            if flush: _log_fh.flush()
     except Exception as e: print(f"Failed to write to log file: {e}", file=sys.stderr)
 
 
@@ -108,87 +274,348 @@ def load_config():
     except (json.JSONDecodeError, IOError) as e: print(f"Warning: Could not load config '{CONFIG_FILENAME}': {e}. Using defaults.", file=sys.stderr); return DEFAULT_CONFIG.copy()
 
 def save_config(config_data):
-    """Saves configuration to JSON file."""
+    """Saves configuration to JSON file atomically (temp file + os.replace, so a crash never leaves a truncated config)."""
+    tmp_filename = CONFIG_FILENAME + ".tmp"
     try:
-        with open(CONFIG_FILENAME, 'w') as f: json.dump(config_data, f, indent=4); print("Info: Configuration saved.")
-    except IOError as e: print(f"Warning: Could not save config '{CONFIG_FILENAME}': {e}", file=sys.stderr)
+        with open(tmp_filename, 'w') as f: json.dump(config_data, f, indent=4); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp_filename, CONFIG_FILENAME); print("Info: Configuration saved.")
+    except OSError as e: print(f"Warning: Could not save config '{CONFIG_FILENAME}': {e}", file=sys.stderr)
 
 
 # --- Database Setup and Helpers ---
+_db_conn = None; _db_lock = threading.RLock() # Shared long-lived connection, serialized across threads
+
+def _connect(read_only=False):
+    """Opens a history DB connection with the tuned PRAGMAs applied (read_only opens it with mode=ro)."""
+    if read_only: conn = sqlite3.connect(Path(DB_FILENAME).as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+    else: conn = sqlite3.connect(DB_FILENAME, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+    for pragma in DB_PRAGMAS: conn.execute(pragma)
+    return conn
+
+def get_db():
+    """Returns the shared history DB connection, opening it on first use."""
+    global _db_conn
+    with _db_lock:
+        if _db_conn is None: _db_conn = _connect()
+        return _db_conn
+
+def close_db():
+    """Closes the shared history DB connection (safe to call more than once)."""
+    global _db_conn
+    with _db_lock:
+        if _db_conn is not None:
+            try: _db_conn.executescript(f"PRAGMA incremental_vacuum({DB_SHUTDOWN_VACUUM_PAGES}); PRAGMA optimize;") # executescript: execute() would stop the vacuum after its first page
+            except sqlite3.Error as e: print(f"DB Maintenance Error: {e}", file=sys.stderr)
+            try: _db_conn.close()
+            except sqlite3.Error as e: print(f"DB Close Error: {e}", file=sys.stderr)
+            _db_conn = None
+atexit.register(close_db)
+
+@contextmanager
+def db_transaction():
+    """Yields the shared connection inside one BEGIN IMMEDIATE ... COMMIT transaction (rolled back on error), holding _db_lock throughout.
+    IMMEDIATE takes the write lock up front, so a bulk insert never has to upgrade a read lock half-way through."""
+    with _db_lock:
+        conn = get_db(); conn.execute("BEGIN IMMEDIATE")
+        try: yield conn
+        except BaseException: conn.rollback(); raise
+        else: conn.commit()
+
 def init_db():
-    """Initializes the SQLite database and adds run_id column if needed."""
+    """Initializes the SQLite database (WAL mode, incremental auto_vacuum for new files) and adds the run_id column / daily_summary table if needed."""
     try:
-        conn = sqlite3.connect(DB_FILENAME); cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS interpretations (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, operator_id TEXT, sample_id TEXT NOT NULL, nil_value REAL, tb1_value REAL, tb2_value REAL, mit_value REAL, result TEXT, reason TEXT, run_id TEXT)''')
-        cursor.execute("PRAGMA table_info(interpretations)"); columns = [info[1] for info in cursor.fetchall()]
-        if 'run_id' not in columns: print("Upgrading DB: Adding 'run_id' column."); cursor.execute('ALTER TABLE interpretations ADD COLUMN run_id TEXT')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sample_id ON interpretations (sample_id)'); cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON interpretations (timestamp)'); cursor.execute('CREATE INDEX IF NOT EXISTS idx_run_id ON interpretations (run_id)')
-        conn.commit(); conn.close(); print(f"Database '{DB_FILENAME}' initialized/verified.")
+        with _db_lock:
+            conn = get_db(); conn.execute("PRAGMA auto_vacuum=INCREMENTAL"); conn.execute("PRAGMA journal_mode=WAL"); cursor = conn.cursor() # auto_vacuum only takes effect before the first table is created
+            cursor.execute('''CREATE TABLE IF NOT EXISTS interpretations (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, operator_id TEXT, sample_id TEXT NOT NULL, nil_value REAL, tb1_value REAL, tb2_value REAL, mit_value REAL, result TEXT, reason TEXT, run_id TEXT)''')
+            cursor.execute("PRAGMA table_info(interpretations)"); columns = [info[1] for info in cursor.fetchall()]
+            if 'run_id' not in columns: print("Upgrading DB: Adding 'run_id' column."); cursor.execute('ALTER TABLE interpretations ADD COLUMN run_id TEXT')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sample_ts ON interpretations (sample_id, timestamp DESC)'); cursor.execute('DROP INDEX IF EXISTS idx_sample_id'); cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON interpretations (timestamp)'); cursor.execute('CREATE INDEX IF NOT EXISTS idx_run_id ON interpretations (run_id)')
+            conn.commit()
+            with db_transaction() as conn: # Summary table, its triggers and the backfill land atomically, so counts never miss rows
+                has_summary = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_summary'").fetchone()
+                if not has_summary or conn.execute("PRAGMA user_version").fetchone()[0] < DB_SCHEMA_VERSION: # Missing, or built by an older version with different bucketing/triggers
+                    print("Upgrading DB: Building 'daily_summary' table.")
+                    for trigger_name in DAILY_SUMMARY_TRIGGER_NAMES: conn.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+                    conn.execute("DROP TABLE IF EXISTS daily_summary"); conn.execute(SQL_CREATE_DAILY_SUMMARY); conn.execute(SQL_BACKFILL_DAILY_SUMMARY); conn.execute(f"PRAGMA user_version = {DB_SCHEMA_VERSION}")
+                for trigger in SQL_DAILY_SUMMARY_TRIGGERS: conn.execute(trigger)
+            print(f"Database '{DB_FILENAME}' initialized/verified.")
     except sqlite3.Error as e: print(f"DB Init/Upgrade Error: {e}", file=sys.stderr); messagebox.showerror("Database Error", f"Could not initialize/upgrade history database:\n{e}")
 
 def save_interpretation_to_db(data):
     """Saves a result dictionary (including run_id) to the database."""
-    conn = None
+    return save_interpretations_bulk([data])
+
+def save_interpretations_bulk(datas, show_errors=True, timestamp=None):
+    """Saves an iterable of result dictionaries in a single transaction (one commit for the whole batch), stamped with timestamp (now by default).
+    Pass show_errors=False from worker threads; failures are then only printed and reported via the return value."""
+    if timestamp is None: timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    datas = datas if isinstance(datas, list) else list(datas)
+    if not datas: return True
+    rows = ((timestamp, d.get('operator_id', 'N/A'), d.get('sample_id', 'N/A'), d.get('run_id', 'N/A'), d.get('input_nil'), d.get('input_tb1'), d.get('input_tb2'), d.get('input_mit'), d.get('result'), d.get('reason')) for d in datas)
+    try:
+        with db_transaction() as conn: # One transaction; rows are materialized DB_INSERT_CHUNK at a time to bound memory
+            fold_summary = len(datas) >= DB_BULK_SUMMARY_ROWS
+            if fold_summary: last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM interpretations").fetchone()[0]; conn.execute("DROP TRIGGER IF EXISTS trg_daily_summary_insert") # Restored below, in the same transaction
+            for chunk in iter(lambda: list(itertools.islice(rows, DB_INSERT_CHUNK)), []): conn.executemany(SQL_INSERT_INTERPRETATION, chunk)
+            if fold_summary: conn.execute(SQL_FOLD_DAILY_SUMMARY, (last_id,)); conn.execute(SQL_DAILY_SUMMARY_INSERT_TRIGGER)
+        if len(datas) >= DB_INSERT_CHUNK: _analyze_history()
+        return True
+    except sqlite3.Error as e:
+        target = datas[0].get('sample_id', 'N/A') if len(datas) == 1 else f"{len(datas)} samples"
+        print(f"DB Save Error: {e}", file=sys.stderr)
+        if show_errors: messagebox.showerror("Database Error", f"Failed to save result to history for {target}:\n{e}")
+        return False
+    except Exception as e:
+        print(f"Unexpected error during DB save: {e}", file=sys.stderr); traceback.print_exc()
+        if show_errors: messagebox.showerror("Save Error", f"Unexpected error saving history:\n{e}")
+        return False
+
+def _analyze_history():
+    """Refreshes the planner statistics after a large import (sampled, see DB_PRAGMAS). Only logs on failure: the rows are already committed."""
     try:
-        conn = sqlite3.connect(DB_FILENAME); cursor = conn.cursor()
-        cursor.execute('''INSERT INTO interpretations (timestamp, operator_id, sample_id, run_id, nil_value, tb1_value, tb2_value, mit_value, result, reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                       (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), data.get('operator_id', 'N/A'), data.get('sample_id', 'N/A'), data.get('run_id', 'N/A'), data.get('input_nil'), data.get('input_tb1'), data.get('input_tb2'), data.get('input_mit'), data.get('result'), data.get('reason')))
-        conn.commit(); return True
-    except sqlite3.Error as e: print(f"DB Save Error: {e}", file=sys.stderr); messagebox.showerror("Database Error", f"Failed to save result to history for {data.get('sample_id','N/A')}:\n{e}"); return False
-    except Exception as e: print(f"Unexpected error during DB save: {e}", file=sys.stderr); traceback.print_exc(); messagebox.showerror("Save Error", f"Unexpected error saving history:\n{e}"); return False
-    finally:
-        if conn: conn.close()
-
-def query_db_for_reports(start_date_str, end_date_str):
-    """Queries DB for results within a date range for reporting."""
-    conn = None; results = []
+        with _db_lock: get_db().execute("ANALYZE interpretations")
+    except sqlite3.Error as e: print(f"DB Analyze Error: {e}", file=sys.stderr)
+
+def _report_range(start_date_str, end_date_str):
+    """Validates a YYYY-MM-DD date range and returns its (start, end) timestamp bounds; raises ValueError on bad dates."""
+    return datetime.strptime(start_date_str, '%Y-%m-%d').strftime('%Y-%m-%d 00:00:00'), datetime.strptime(end_date_str, '%Y-%m-%d').strftime('%Y-%m-%d 23:59:59')
+
+def query_db_for_reports(conn, start_date_str, end_date_str):
+    """Returns a cursor over the report rows within a date range; iterating it streams the rows instead of fetching them all. Raises on DB/date errors."""
+    return conn.execute(SQL_SELECT_REPORT_RANGE, _report_range(start_date_str, end_date_str))
+
+def query_report_summary(start_date_str, end_date_str, conn=None):
+    """Aggregates a summary report in SQL without fetching rows. Returns (total, pos, neg, ind, ind_reasons, run_count, operator_count), or None on error.
+    conn: query through this connection (e.g. a read snapshot shared with query_db_for_reports) instead of the shared one."""
     try:
-        start_dt = datetime.strptime(start_date_str, '%Y-%m-%d').strftime('%Y-%m-%d 00:00:00')
-        end_dt = datetime.strptime(end_date_str, '%Y-%m-%d').strftime('%Y-%m-%d 23:59:59')
-        conn = sqlite3.connect(DB_FILENAME); cursor = conn.cursor()
-        cursor.execute("SELECT timestamp, operator_id, run_id, sample_id, result, reason FROM interpretations WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp ASC", (start_dt, end_dt))
-        results = cursor.fetchall(); return results
-    except sqlite3.Error as e: messagebox.showerror("Database Error", f"Failed to query history for report:\n{e}"); return []
-    except ValueError: messagebox.showerror("Date Error", "Invalid date format. Please use YYYY-MM-DD."); return []
-    finally:
-        if conn: conn.close()
+        start_dt, end_dt = _report_range(start_date_str, end_date_str)
+        with (nullcontext() if conn else _db_lock):
+            conn = conn or get_db(); total, pos, neg, ind, ind_reasons = _dashboard_counts(conn, start_date_str, end_date_str); run_count, operator_count = conn.execute(SQL_REPORT_DISTINCT, (start_dt, end_dt)).fetchone()
+        return total, pos, neg, ind, ind_reasons, run_count, operator_count
+    except sqlite3.Error as e: messagebox.showerror("Database Error", f"Failed to query history for report:\n{e}"); return None
+    except ValueError: messagebox.showerror("Date Error", "Invalid date format. Please use YYYY-MM-DD."); return None
+
+def _dashboard_counts(conn, start_date_str, end_date_str):
+    """Sums the daily_summary counts for a date range on conn. Returns (total, pos, neg, ind, ind_reasons Counter)."""
+    start_day = datetime.strptime(start_date_str, '%Y-%m-%d').strftime('%Y-%m-%d'); end_day = datetime.strptime(end_date_str, '%Y-%m-%d').strftime('%Y-%m-%d')
+    total = 0; result_counts = Counter(); ind_reasons = Counter()
+    for result, ind_bucket, count in conn.execute(SQL_DASHBOARD_COUNTS, (start_day, end_day)):
+        total += count; result_counts[result] += count
+        if ind_bucket: ind_reasons[ind_bucket] += count
+    return total, result_counts["POS†"], result_counts["NEG"], result_counts["IND*"], ind_reasons
+
+def query_dashboard_counts(start_date_str, end_date_str, read_only=False):
+    """Sums the daily_summary counts for a date range. Returns (total, pos, neg, ind, ind_reasons Counter); raises on DB/date errors.
+    read_only=True queries through a private read-only connection instead of the shared one (for background refreshes)."""
+    if read_only:
+        conn = _connect(read_only=True)
+        try: return _dashboard_counts(conn, start_date_str, end_date_str)
+        finally: conn.close()
+    with _db_lock: return _dashboard_counts(get_db(), start_date_str, end_date_str)
 
 # --- Core Interpretation Logic ---
+QFT_CODE_NEG, QFT_CODE_POS_TB1, QFT_CODE_POS_TB2, QFT_CODE_IND_HIGH_NIL, QFT_CODE_IND_LOW_MIT = range(5) # Classification codes
+QFT_CODE_RESULTS = ("NEG", "POS†", "POS†", "IND*", "IND*") # Final result string, indexed by classification code
+QFT_NEG_REASON = "TB Antigens negative, Mitogen control valid" # Constant reason, shared by every NEG row
+QFT_REASON_BUILDERS = (lambda nil, tb1n, tb2n, mitn: QFT_NEG_REASON, # Reason text builders, indexed by classification code; only value-bearing reasons are formatted
+                       lambda nil, tb1n, tb2n, mitn: f"TB1 Antigen positive (TB1-Nil={tb1n:.3f} IU/mL)",
+                       lambda nil, tb1n, tb2n, mitn: f"TB2 Antigen positive (TB2-Nil={tb2n:.3f} IU/mL)",
+                       lambda nil, tb1n, tb2n, mitn: f"High Nil Control ({nil:.3f} > 8.0 IU/mL)",
+                       lambda nil, tb1n, tb2n, mitn: f"Low Mitogen Control (Mit-Nil={mitn:.3f} < 0.5 IU/mL difference)")
+
+def _qft_result_dict(code, nil, tb1, tb2, mit, tb1_minus_nil, tb2_minus_nil, mit_minus_nil, nil_25_percent):
+    """Builds the interpretation result dictionary (with reason text) for a classification code."""
+    reason = QFT_REASON_BUILDERS[code](nil, tb1_minus_nil, tb2_minus_nil, mit_minus_nil)
+    return {"result":QFT_CODE_RESULTS[code], "tb1_nil":tb1_minus_nil, "tb2_nil":tb2_minus_nil, "mit_nil":mit_minus_nil, "nil_25":nil_25_percent, "reason":reason, "input_nil":nil, "input_tb1":tb1, "input_tb2":tb2, "input_mit":mit}
+
 def interpret_qft(nil, tb1, tb2, mit):
     """ Interprets QFT results, returns a dictionary. """
-    tb1_minus_nil=tb1-nil; tb2_minus_nil=tb2-nil; mit_minus_nil=mit-nil; nil_25_percent=0.25*nil if nil>=0 else 0; qft_result=""; reason=""
-    if nil>8.0: qft_result="IND*"; reason=f"High Nil Control ({nil:.3f} > 8.0 IU/mL)"
+    tb1_minus_nil=tb1-nil; tb2_minus_nil=tb2-nil; mit_minus_nil=mit-nil; nil_25_percent=0.25*nil if nil>=0 else 0
+    if nil>8.0: code=QFT_CODE_IND_HIGH_NIL
     else:
         is_tb1_pos=tb1_minus_nil>=0.35 and tb1_minus_nil>=nil_25_percent; is_tb2_pos=tb2_minus_nil>=0.35 and tb2_minus_nil>=nil_25_percent
-        if is_tb1_pos: qft_result="POS†"; reason=f"TB1 Antigen positive (TB1-Nil={tb1_minus_nil:.3f} IU/mL)"
-        elif is_tb2_pos: qft_result="POS†"; reason=f"TB2 Antigen positive (TB2-Nil={tb2_minus_nil:.3f} IU/mL)"
-        else:
-            if mit_minus_nil>=0.5: qft_result="NEG"; reason="TB Antigens negative, Mitogen control valid"
-            else: qft_result="IND*"; reason=f"Low Mitogen Control (Mit-Nil={mit_minus_nil:.3f} < 0.5 IU/mL difference)"
-    return {"result":qft_result, "tb1_nil":tb1_minus_nil, "tb2_nil":tb2_minus_nil, "mit_nil":mit_minus_nil, "nil_25":nil_25_percent, "reason":reason, "input_nil":nil, "input_tb1":tb1, "input_tb2":tb2, "input_mit":mit}
+        if is_tb1_pos: code=QFT_CODE_POS_TB1
+        elif is_tb2_pos: code=QFT_CODE_POS_TB2
+        elif mit_minus_nil>=0.5: code=QFT_CODE_NEG
+        else: code=QFT_CODE_IND_LOW_MIT
+    return _qft_result_dict(code, nil, tb1, tb2, mit, tb1_minus_nil, tb2_minus_nil, mit_minus_nil, nil_25_percent)
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True)
+    def _classify_qft_kernel(nil, tb1, tb2, mit, out_code):
+        """JIT-compiled classification kernel: writes a QFT_CODE_* value per row into out_code."""
+        for i in prange(nil.shape[0]):
+            n = nil[i]; threshold = max(0.35, 0.25 * n if n >= 0 else 0.0)
+            if n > 8.0: out_code[i] = 3 # QFT_CODE_IND_HIGH_NIL
+            elif tb1[i] - n >= threshold: out_code[i] = 1 # QFT_CODE_POS_TB1
+            elif tb2[i] - n >= threshold: out_code[i] = 2 # QFT_CODE_POS_TB2
+            elif mit[i] - n >= 0.5: out_code[i] = 0 # QFT_CODE_NEG
+            else: out_code[i] = 4 # QFT_CODE_IND_LOW_MIT
+
+_BATCH_VALUE_COLUMNS = itemgetter('nil', 'tb1', 'tb2', 'mitogen') # Value columns of a validated batch row, in interpret_qft argument order
+
+def interpret_qft_batch(nils, tb1s, tb2s, mits):
+    """Interprets a whole batch of samples at once (vectorized with NumPy when available). Returns a list of result dictionaries."""
+    if not NUMPY_AVAILABLE: return [interpret_qft(*values) for values in zip(nils, tb1s, tb2s, mits)]
+    nil=np.asarray(nils, dtype=np.float64); tb1=np.asarray(tb1s, dtype=np.float64); tb2=np.asarray(tb2s, dtype=np.float64); mit=np.asarray(mits, dtype=np.float64)
+    tb1n=tb1-nil; tb2n=tb2-nil; mitn=mit-nil; nil25=np.where(nil>=0, 0.25*nil, 0.0)
+    if NUMBA_AVAILABLE: codes=np.empty(nil.shape[0], dtype=np.int8); _classify_qft_kernel(nil, tb1, tb2, mit, codes)
+    else:
+        threshold=np.maximum(0.35, nil25); high_nil=nil>8.0; tb1_pos=tb1n>=threshold; tb2_pos=tb2n>=threshold; mit_valid=mitn>=0.5
+        codes=np.select([high_nil, tb1_pos, tb2_pos, mit_valid], [QFT_CODE_IND_HIGH_NIL, QFT_CODE_POS_TB1, QFT_CODE_POS_TB2, QFT_CODE_NEG], default=QFT_CODE_IND_LOW_MIT)
+    return [_qft_result_dict(*row) for row in zip(codes.tolist(), nil.tolist(), tb1.tolist(), tb2.tolist(), mit.tolist(), tb1n.tolist(), tb2n.tolist(), mitn.tolist(), nil25.tolist())]
 
 def get_previous_result(sample_id):
     """Queries DB for the most recent result for a given Sample ID."""
-    conn=None;
-    try: conn=sqlite3.connect(DB_FILENAME); cursor=conn.cursor(); cursor.execute("SELECT result, timestamp FROM interpretations WHERE sample_id = ? ORDER BY timestamp DESC LIMIT 1", (sample_id,)); result=cursor.fetchone(); return result
+    try:
+        with _db_lock: return get_db().execute(SQL_SELECT_PREVIOUS, (sample_id,)).fetchone()
     except sqlite3.Error as e: log_event("ERROR", sample_id=sample_id, details=f"Delta Check DB Error: {e}"); return None
-    finally:
-        if conn: conn.close()
+
+_DELTA_RESULT_CODES = {"NEG": 0, "POS†": 1, "IND*": 2} # Row/column index into _DELTA_SIGNIFICANT
+_DELTA_SIGNIFICANT = bytes([0, 1, 1,  1, 0, 1,  1, 1, 0]) # 3x3 prev x curr table: any change between NEG/POS/IND is significant
 
 def check_significant_change(prev_res, curr_res):
     """Determines if a result change is significant for Delta Check."""
-    if prev_res == curr_res: return False
-    significant_pairs={("NEG", "POS†"),("POS†", "NEG"),("NEG", "IND*"),("POS†", "IND*")};
-    if (prev_res, curr_res) in significant_pairs or (curr_res, prev_res) in significant_pairs: return True
-    if prev_res == "IND*" and curr_res in ("POS†", "NEG"): return True
-    if curr_res == "IND*" and prev_res in ("POS†", "NEG"): return True
-    return False
+    try: return bool(_DELTA_SIGNIFICANT[_DELTA_RESULT_CODES[prev_res] * 3 + _DELTA_RESULT_CODES[curr_res]])
+    except KeyError: return False
+
+def _summary_metric_rows(total, pos, neg, ind, pos_r, neg_r, ind_r, ind_reasons, run_count, operator_count):
+    """(label, value) rows of the summary report's metric table; counts stay numbers, rates are formatted text."""
+    return [("Total Interpretations:", total), ("Positive Results (POS†):", pos), ("Negative Results (NEG):", neg), ("Indeterminate Results (IND*):", ind), ("    - IND (High Nil):", ind_reasons.get("High Nil", 0)), ("    - IND (Low Mitogen):", ind_reasons.get("Low Mitogen", 0)), ("    - IND (Other):", ind_reasons.get("Other", 0)), ("Positivity Rate:", f"{pos_r:.1f}%"), ("Negativity Rate:", f"{neg_r:.1f}%"), ("Indeterminate Rate:", f"{ind_r:.1f}%"), ("Unique Run IDs:", run_count), ("Unique Operators:", operator_count)]
+
+def _styled_cell(ws, value, named_style=None, **style):
+    """Builds a WriteOnlyCell for a write_only worksheet with the given style attributes (font, alignment, border, fill, number_format),
+    or with a named style registered once by _cell_style (no per-cell style-table lookups)."""
+    cell = WriteOnlyCell(ws, value=value)
+    if named_style is not None: cell.style = named_style
+    for name, style_value in style.items(): setattr(cell, name, style_value)
+    return cell
+
+def _set_column_widths(ws, widths):
+    """Applies {column letter: width} to an openpyxl worksheet."""
+    for column_letter, width in widths.items(): ws.column_dimensions[column_letter].width = width
+
+@lru_cache(maxsize=64)
+def _batch_column_indices(headers):
+    """Maps a normalized (stripped, lower-case) header tuple to (column indices in BATCH_HEADER_ORDER, sorted missing headers). Memoized: repeated imports of one template skip the scan."""
+    positions = {}
+    for i, header in enumerate(headers):
+        if header in REQUIRED_BATCH_HEADERS: positions[header] = i
+    missing_headers = tuple(sorted(REQUIRED_BATCH_HEADERS - positions.keys()))
+    return (None if missing_headers else tuple(positions[header] for header in BATCH_HEADER_ORDER)), missing_headers
+
+def _batch_excel_values(r):
+    """Cell values of one batch results row, in BATCH_EXCEL_HEADERS order."""
+    return (r.get('sample_id',''), r.get('operator_id',''), r.get('input_nil'), r.get('input_tb1'), r.get('input_tb2'), r.get('input_mit'), r.get('result','Error'), r.get('reason',''), r.get('nil_25'), r.get('tb1_nil'), r.get('tb2_nil'), r.get('mit_nil'))
+
+def _cell_style(ws, name, **style):
+    """Registers style attributes as a NamedStyle on the worksheet's workbook (once per name) and returns its name; pass it to _styled_cell for every cell that shares the style."""
+    if name not in ws.parent.named_styles: ws.parent.add_named_style(NamedStyle(name=name, **{'font': DEFAULT_FONT, **style})) # Unstyled fonts keep the workbook default (NamedStyle's own default has no name/size)
+    return name
+
+def _xlsx_text(elem):
+    """Plain text of a shared/inline string item (<t> plus rich-text runs; phonetic runs are ignored, as in openpyxl)."""
+    if elem is None: return None
+    text = elem.findtext(f"{XLSX_NS}t")
+    return "".join(([text] if text is not None else []) + [run.findtext(f"{XLSX_NS}t") or "" for run in elem.iterfind(f"{XLSX_NS}r")])
+
+def _xlsx_sheet_layout(archive):
+    """Locates the active worksheet of an open .xlsx archive. Returns (sheet part name, shared strings, date style ids, timedelta style ids, epoch).
+    Raises KeyError/IndexError/ValueError/ET.ParseError when the package does not use the standard layout."""
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    view = workbook.find(f"{XLSX_NS}bookViews/{XLSX_NS}workbookView")
+    rel_id = workbook.findall(f"{XLSX_NS}sheets/{XLSX_NS}sheet")[int(view.get("activeTab", 0)) if view is not None else 0].get(XLSX_REL_ID)
+    rel = next(r for r in ET.fromstring(archive.read("xl/_rels/workbook.xml.rels")) if r.get("Id") == rel_id)
+    if rel.get("Type") != XLSX_WORKSHEET_REL: raise ValueError("Active sheet is not a worksheet")
+    target = rel.get("Target"); sheet_path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    props = workbook.find(f"{XLSX_NS}workbookPr"); epoch = CALENDAR_MAC_1904 if props is not None and props.get("date1904") in ("1", "true") else CALENDAR_WINDOWS_1900
+    strings = []
+    if "xl/sharedStrings.xml" in archive.NameToInfo:
+        with archive.open("xl/sharedStrings.xml") as source:
+            for _, elem in ET.iterparse(source):
+                if elem.tag == f"{XLSX_NS}si": strings.append(_xlsx_text(elem).replace("x005F_", "")); elem.clear()
+    date_styles = set(); timedelta_styles = set()
+    if "xl/styles.xml" in archive.NameToInfo:
+        styles = ET.fromstring(archive.read("xl/styles.xml"))
+        custom = {int(f.get("numFmtId")): f.get("formatCode") for f in styles.iterfind(f"{XLSX_NS}numFmts/{XLSX_NS}numFmt")}
+        for idx, xf in enumerate(styles.iterfind(f"{XLSX_NS}cellXfs/{XLSX_NS}xf")):
+            fmt_id = int(xf.get("numFmtId", 0)); fmt = custom[fmt_id] if fmt_id in custom else BUILTIN_FORMATS.get(fmt_id)
+            if is_date_format(fmt): date_styles.add(idx)
+            if is_timedelta_format(fmt): timedelta_styles.add(idx)
+    return sheet_path, strings, date_styles, timedelta_styles, epoch
+
+def _xlsx_column(letters):
+    """1-based column index of a column name such as "AB"."""
+    col = 0
+    for ch in letters: col = col * 26 + ord(ch) - 64
+    return col
+
+def _openpyxl_sheet_rows(filepath):
+    """Yields the active sheet of an .xlsx file row by row as value tuples (None for empty cells), via openpyxl's read-only iter_rows(values_only=True)."""
+    _import_openpyxl(); wb = load_workbook(filename=filepath, read_only=True, data_only=True)
+    try: yield from wb.active.iter_rows(values_only=True)
+    finally: wb.close()
+
+def _stream_xlsx_rows(filepath):
+    """Opt-in fast path for _openpyxl_sheet_rows (config "fast_xlsx_import"): parses the sheet XML incrementally, without openpyxl's per-cell objects.
+    Meant to produce the same rows as openpyxl's read-only iter_rows(values_only=True); falls back to openpyxl for non-standard packages."""
+    _import_openpyxl()
+    with zipfile.ZipFile(filepath) as archive:
+        try: sheet_path, strings, date_styles, timedelta_styles, epoch = _xlsx_sheet_layout(archive); archive.getinfo(sheet_path)
+        except (KeyError, IndexError, ValueError, StopIteration, ET.ParseError): sheet_path = None
+        if sheet_path is None: yield from _openpyxl_sheet_rows(filepath); return
+        row_tag, cell_tag, value_tag, inline_tag, dim_tag = (f"{XLSX_NS}{t}" for t in ("row", "c", "v", "is", "dimension"))
+        max_col = max_row = None; empty_row = (); next_row = 1; row_counter = 0; columns = {} # Column letters -> index, filled as references are seen
+        with archive.open(sheet_path) as source:
+            for _, elem in ET.iterparse(source):
+                tag = elem.tag
+                if tag == row_tag:
+                    r = elem.get("r"); row_counter = int(float(r)) if r else row_counter + 1
+                    if max_row is not None and row_counter > max_row: break
+                    while next_row < row_counter: next_row += 1; yield empty_row
+                    if next_row == row_counter:
+                        cells = []; col_counter = 0
+                        for c in elem:
+                            if c.tag != cell_tag: continue
+                            ref = c.get("r")
+                            if ref:
+                                letters = ref.rstrip("0123456789"); col_counter = columns.get(letters) or columns.setdefault(letters, _xlsx_column(letters))
+                            else: col_counter += 1
+                            data_type = c.get("t", "n")
+                            if data_type == "inlineStr": value = _xlsx_text(c.find(inline_tag))
+                            else:
+                                value = c.findtext(value_tag) or None
+                                if value is not None:
+                                    if data_type == "n":
+                                        value = float(value) if "." in value or "E" in value or "e" in value else int(value)
+                                        style_id = int(c.get("s") or 0)
+                                        if style_id in date_styles:
+                                            try: value = from_excel(value, epoch, timedelta=style_id in timedelta_styles)
+                                            except (OverflowError, ValueError): value = "#VALUE!"
+                                    elif data_type == "s": value = strings[int(value)]
+                                    elif data_type == "b": value = bool(int(value))
+                                    elif data_type == "d": value = from_ISO8601(value)
+                            cells.append((col_counter, value))
+                        width = max_col or (cells[-1][0] if cells else 0); row = [None] * width
+                        for col, value in cells:
+                            if 1 <= col <= width: row[col - 1] = value
+                        next_row += 1; yield tuple(row)
+                    elem.clear()
+                elif tag == dim_tag:
+                    try: _, _, max_col, max_row = range_boundaries(elem.get("ref")); empty_row = (None,) * max_col
+                    except (TypeError, ValueError): pass
+
+def _is_blank_sheet_row(row_values):
+    """True if every cell of a worksheet row is empty or whitespace-only text (numbers, including 0, are values). Stops at the first value, with no str() per cell."""
+    for v in row_values:
+        if v.__class__ is not str or v.strip(): return False
+    return True
 
 # --- GUI Application Class ---
 class QFTApp:
     def __init__(self, master):
         self.master = master
-        self.config = load_config()
+        self.config = load_config(); self._saved_config = dict(self.config) # Snapshot used to skip saving an unchanged config
         self.is_processing = False
         init_db()
         log_event("INFO", details=f"Application Started. Version: {APP_VERSION}")
@@ -197,17 +624,20 @@ class QFTApp:
         master.geometry(self.config.get("geometry", "700x750")) # Use loaded geometry
 
         # Styles and Theme Setup
-        self.style = ttk.Style(); self.available_themes = self.style.theme_names()
+        self.style = ttk.Style(); self.available_themes = self.style.theme_names(); self._styled_themes = set()
         self.current_theme = tk.StringVar(value=self.config.get("theme", "clam"))
         try:
             if self.current_theme.get() not in self.available_themes: self.current_theme.set("clam")
             self.style.theme_use(self.current_theme.get())
         except: self.current_theme.set(self.style.theme_use());
-        self._configure_styles()
+        self._configure_styles(); self._pdf_styles = None; self._pdf_table_styles = {} # Built by _build_pdf_styles on the first PDF export
 
         self.last_results = None; self.clipboard_content = tk.StringVar()
-        self.worklist_items = []
-        self._barcode_buffer = ""; self._last_key_time = 0
+        self.worklist_items = []; self._worklist_set = set() # Ordered list for the Listbox + set mirror for O(1) duplicate checks
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qft-worker"); self._ui_queue = queue.Queue() # Background worker + results/progress hand-off to the Tk thread
+        self._pending_saves = [] # (future, results_dict, timestamp) of single-sample saves queued on the worker
+        self._barcode_buffer = []; self._last_key_time = 0
+        self._flowchart_photo = None # Cached flowchart PhotoImage, created on first show_flowchart
 
         # --- Menu Bar ---
         self.menu_bar = tk.Menu(master); master.config(menu=self.menu_bar)
@@ -245,7 +675,7 @@ class QFTApp:
         ttk.Label(input_frame, text="Mitogen Control (Mit):").grid(row=6, column=0, sticky="w", padx=5, pady=5); self.mit_entry = ttk.Entry(input_frame, width=15, justify='right'); self.mit_entry.grid(row=6, column=1, padx=5, pady=5); ttk.Label(input_frame, text="IU/mL").grid(row=6, column=2, sticky="w", padx=2)
         self.op_id_entry.focus_set()
         self.mit_entry.bind("<Return>", self.run_interpretation)
-        master.bind('<Key>', self.handle_key_event)
+        self.sample_id_entry.bind('<Key>', self.handle_key_event); self.run_id_entry.bind('<Key>', self.handle_key_event) # Barcode scanning only applies to the ID fields
 
         # --- Button Frame ---
         button_frame = ttk.Frame(master, padding="15 5 15 10"); button_frame.grid(row=2, column=0, sticky="ew") # Shifted down
@@ -288,15 +718,70 @@ class QFTApp:
     # --- _write_summary_excel, on_closing) are included below ---
 
     def _configure_styles(self):
-        """Configure custom styles."""
-        self.style.configure('TLabel', font=('Segoe UI', 10)); self.style.configure('TButton', font=('Segoe UI', 10, 'bold'), padding=5)
-        self.style.configure('TEntry', font=('Segoe UI', 10), padding=3); self.style.configure('Header.TLabel', font=('Segoe UI', 12, 'bold'))
-        self.style.configure('ResultPOS.TLabel', font=('Segoe UI', 16, 'bold'), foreground='red'); self.style.configure('ResultNEG.TLabel', font=('Segoe UI', 16, 'bold'), foreground='darkgreen')
-        self.style.configure('ResultIND.TLabel', font=('Segoe UI', 16, 'bold'), foreground='red'); self.style.configure('ResultDefault.TLabel', font=('Segoe UI', 16, 'bold'), foreground='black')
-        self.style.configure('Status.TLabel', font=('Segoe UI', 9), padding=2)
-
-    def set_status(self, message):
-        self.status_var.set(message); self.master.update_idletasks()
+        """Configure custom styles. ttk keeps style settings per theme, so each theme is only configured once."""
+        theme = self.style.theme_use()
+        if theme in self._styled_themes: return
+        for style_name, options in STYLE_SPEC: self.style.configure(style_name, **options)
+        self._styled_themes.add(theme)
+
+    def _build_pdf_styles(self):
+        """Imports ReportLab and builds the stylesheet and table styles on the first PDF export. Exports share them read-only instead of re-creating (and mutating) getSampleStyleSheet() per call."""
+        if self._pdf_styles is not None or not REPORTLAB_AVAILABLE: return
+        _import_reportlab(); styles = getSampleStyleSheet(); styles.add(ParagraphStyle(name='Disclaimer', parent=styles['Italic'], fontSize=9))
+        for name, color in (('ResultPOS', colors.red), ('ResultIND', colors.red), ('ResultNEG', colors.darkgreen), ('ResultDefault', colors.black)): styles.add(ParagraphStyle(name=name, parent=styles['h2'], textColor=color))
+        table_styles = {'result': TableStyle([('BACKGROUND',(0,0),(-1,0),colors.grey),('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),('ALIGN',(0,0),(-1,-1),'CENTER'),('VALIGN',(0,0),(-1,-1),'MIDDLE'),('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),('BOTTOMPADDING',(0,0),(-1,0),12),('BACKGROUND',(0,1),(-1,-1),colors.beige),('GRID',(0,0),(-1,-1),1,colors.black),('FONTSIZE',(0,0),(-1,-1),10),('ALIGN',(1,1),(1,-1),'RIGHT'),('ALIGN',(3,1),(3,-1),'RIGHT'),('RIGHTPADDING',(1,1),(1,-1),10),('RIGHTPADDING',(3,1),(3,-1),10)]),
+                                  'batch': TableStyle([('BACKGROUND',(0,0),(-1,0),colors.grey), ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),('ALIGN',(0,0),(-1,0),'CENTER'), ('VALIGN',(0,0),(-1,-1),'MIDDLE'),('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'), ('FONTSIZE',(0,0),(-1,-1),8),('BOTTOMPADDING',(0,0),(-1,0),10), ('TOPPADDING',(0,0),(-1,0),4),('BACKGROUND',(0,1),(-1,-1),colors.whitesmoke),('GRID',(0,0),(-1,-1),0.5,colors.black),('ALIGN',(2,1),(6,-1),'RIGHT'),('FONTSIZE',(7,1),(7,-1),10)]),
+                                  'summary': TableStyle([('GRID',(0,0),(-1,-1),1,colors.black), ('BACKGROUND',(0,0),(-1,0),colors.grey), ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke), ('ALIGN',(0,0),(-1,0),'CENTER'), ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'), ('BOTTOMPADDING',(0,0),(-1,-1),6), ('TOPPADDING',(0,0),(-1,-1),6), ('ALIGN',(0,1),(0,-1),'LEFT'), ('ALIGN',(1,1),(1,-1),'RIGHT')])}
+        self._pdf_table_styles = table_styles; self._pdf_styles = styles # _pdf_styles is the built-once guard, so it is published last
+
+    def set_status(self, message, refresh=False):
+        """Sets the status bar text. Tk repaints on its next idle cycle; pass refresh=True only before a blocking operation."""
+        self.status_var.set(message)
+        if refresh: self.master.update_idletasks()
+
+    # --- Background Work Helpers ---
+    def _run_in_background(self, func, *args, on_success=None, on_error=None, **kwargs):
+        """Runs func(*args, **kwargs) on the background worker; on_success/on_error are called on the Tk thread."""
+        future = self._executor.submit(func, *args, **kwargs); self.master.after(UI_POLL_INTERVAL_MS, self._poll_background, future, on_success, on_error)
+        return future
+
+    def _save_in_background(self, results_dict):
+        """Queues a single result for saving on the worker (stamped now, so _previous_result can report it before it is committed). Saves still queued at shutdown are written by on_closing."""
+        sample_id = results_dict.get('sample_id', 'N/A'); timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        future = self._run_in_background(save_interpretations_bulk, [results_dict], show_errors=False, timestamp=timestamp, on_success=lambda save_ok: self._on_db_save_done(save_ok, sample_id))
+        self._pending_saves = [entry for entry in self._pending_saves if not entry[0].done()]; self._pending_saves.append((future, results_dict, timestamp))
+
+    def _previous_result(self, sample_id):
+        """Delta Check lookup: the most recent (result, timestamp) for a Sample ID, including single-sample saves still queued on the worker (not yet in the DB)."""
+        for future, results_dict, timestamp in reversed(self._pending_saves):
+            if not future.done() and results_dict.get('sample_id') == sample_id: return results_dict.get('result'), timestamp
+        return get_previous_result(sample_id)
+
+    def _on_db_save_done(self, save_ok, sample_id):
+        """Main-thread completion of a background single-sample save."""
+        if not save_ok: messagebox.showerror("Database Error", f"Failed to save result to history for {sample_id}."); self.set_status("Warning: Failed to save to history DB.")
+
+    def _post_to_ui(self, func, *args):
+        """Queues func(*args) to run on the Tk thread (safe to call from the worker)."""
+        self._ui_queue.put((func, args))
+
+    def _poll_background(self, future, on_success, on_error):
+        """Drains queued UI calls and dispatches the future's outcome once it is done (polled from the Tk loop).
+        Consecutive status updates queued between two polls collapse to the latest one, so progress costs at most one Tk call per poll.
+        done is read before the drain, so calls the task posted just before finishing are dispatched before on_success/on_error."""
+        done = future.done(); pending = []
+        while True:
+            try: pending.append(self._ui_queue.get_nowait())
+            except queue.Empty: break
+        for i, (func, args) in enumerate(pending):
+            if func == self.set_status and i + 1 < len(pending) and pending[i + 1][0] == self.set_status: continue
+            func(*args)
+        if not done: self.master.after(UI_POLL_INTERVAL_MS, self._poll_background, future, on_success, on_error); return
+        error = future.exception()
+        if error is not None:
+            if on_error: on_error(error)
+            else: print(f"Background task failed: {error}", file=sys.stderr)
+        elif on_success: on_success(future.result())
 
     def validate_input(self, value_str):
         if not value_str: return False, "Input cannot be empty."
@@ -309,20 +794,15 @@ class QFTApp:
         self.result_label_var.set("---"); self.result_label.configure(style='ResultDefault.TLabel'); self.export_pdf_button.config(state=tk.DISABLED); self.export_excel_button.config(state=tk.DISABLED); self.copy_button.config(state=tk.DISABLED); self.last_results = None; self.sample_id_entry.focus_set(); self.set_status("Fields Cleared. Ready.")
 
     def handle_key_event(self, event):
-        """Handles key presses for potential barcode scanning."""
-        focused_widget = self.master.focus_get()
-        if focused_widget not in (self.sample_id_entry, self.run_id_entry): self._barcode_buffer = ""; return
-        current_time = time.time()
-        if (current_time - self._last_key_time) < BARCODE_INTERKEY_DELAY:
-            if event.char and event.char.isprintable(): self._barcode_buffer += event.char
-        else:
-            if event.char and event.char.isprintable(): self._barcode_buffer = event.char
-            else: self._barcode_buffer = ""
+        """Handles key presses in the Sample/Run ID entries for potential barcode scanning."""
+        current_time = time.time(); char = event.char
+        if (current_time - self._last_key_time) >= BARCODE_INTERKEY_DELAY: self._barcode_buffer.clear() # Too slow for a scanner: start a new buffer
+        if char in BARCODE_PRINTABLE_CHARS: self._barcode_buffer.append(char)
         self._last_key_time = current_time
         if event.keysym == 'Return' and len(self._barcode_buffer) >= BARCODE_MIN_LEN:
-            current_value = self._barcode_buffer; focused_widget.delete(0, tk.END); focused_widget.insert(0, current_value); self._barcode_buffer = ""
-            if focused_widget == self.sample_id_entry: self.nil_entry.focus_set()
-            elif focused_widget == self.run_id_entry: self.sample_id_entry.focus_set()
+            widget = event.widget; current_value = "".join(self._barcode_buffer); widget.delete(0, tk.END); widget.insert(0, current_value); self._barcode_buffer.clear()
+            if widget == self.sample_id_entry: self.nil_entry.focus_set()
+            elif widget == self.run_id_entry: self.sample_id_entry.focus_set()
             return "break"
 
     def run_interpretation(self, event=None, input_data=None):
@@ -346,7 +826,7 @@ class QFTApp:
                 nil_val=validated_values["Nil"]; tb1_val=validated_values["TB1"]; tb2_val=validated_values["TB2"]; mit_val=validated_values["Mitogen"]
             else: op_id=input_data['operator_id']; run_id=input_data['run_id']; sample_id=input_data['sample_id']; nil_val=input_data['nil']; tb1_val=input_data['tb1']; tb2_val=input_data['tb2']; mit_val=input_data['mitogen']
 
-            previous_db_result = get_previous_result(sample_id)
+            previous_db_result = self._previous_result(sample_id)
             if input_data is None:
                 if 1.0 < nil_val <= 8.0: warnings.append(f"Nil ({nil_val:.3f}) high but acceptable.")
                 if mit_val > 15.0: warnings.append(f"Mitogen ({mit_val:.3f}) very high.")
@@ -367,26 +847,19 @@ class QFTApp:
 
             if warnings and input_data is None: messagebox.showwarning("Interpretation Warnings", "Please note:\n\n" + "\n".join(warnings))
 
-            log_details_subset = {'nil': f"{results_dict['input_nil']:.3f}", 'tb1': f"{results_dict['input_tb1']:.3f}", 'tb2': f"{results_dict['input_tb2']:.3f}", 'mit': f"{results_dict['input_mit']:.3f}" }
+            log_details_subset = {'nil': results_dict['input_nil'], 'tb1': results_dict['input_tb1'], 'tb2': results_dict['input_tb2'], 'mit': results_dict['input_mit']}
             log_event(event_type="INTERPRET", op_id=results_dict['operator_id'], run_id=results_dict['run_id'], sample_id=results_dict['sample_id'], result=results_dict['result'], reason=results_dict['reason'], details=log_details_subset)
 
-            save_successful = save_interpretation_to_db(results_dict)
-            if not save_successful and input_data is None: self.set_status("Warning: Failed to save to history DB.")
+            if input_data is None: self._save_in_background(results_dict) # The SQLite commit runs on the worker; the result panel updates immediately
+            else: save_interpretation_to_db(results_dict)
 
             if input_data is None:
-                self.last_results = results_dict; output_string = self.format_results_text(results_dict); self.results_text.config(state='normal'); self.results_text.delete('1.0', tk.END); self.results_text.insert(tk.END, output_string)
-                final_result = results_dict['result']; self.result_label_var.set(final_result)
-                if "POS" in final_result: self.result_label.configure(style='ResultPOS.TLabel')
-                elif "NEG" in final_result: self.result_label.configure(style='ResultNEG.TLabel')
-                elif "IND" in final_result: self.result_label.configure(style='ResultIND.TLabel')
-                else: self.result_label.configure(style='ResultDefault.TLabel')
-                result_line_index = None;
-                for i, line in enumerate(output_string.splitlines()):
-                     if line.strip().startswith("QFT RESULT"): result_line_index = i + 1; break
-                if result_line_index:
-                     line_start = f"{result_line_index}.0"; line_end = f"{result_line_index}.end"; self.results_text.tag_remove("pos_ind_result", "1.0", tk.END); self.results_text.tag_remove("neg_result", "1.0", tk.END)
-                     if "IND" in results_dict["result"] or "POS" in results_dict["result"]: self.results_text.tag_add("pos_ind_result", line_start, line_end)
-                     elif "NEG" in results_dict["result"]: self.results_text.tag_add("neg_result", line_start, line_end)
+                self.last_results = results_dict; output_string, result_line_index = self.format_results_text(results_dict); self.results_text.config(state='normal'); self.results_text.delete('1.0', tk.END); self.results_text.insert(tk.END, output_string)
+                final_result = results_dict['result']; result_key = _result_code(final_result); self.result_label_var.set(final_result)
+                self.result_label.configure(style=RESULT_LABEL_STYLES.get(result_key, 'ResultDefault.TLabel'))
+                self.results_text.tag_remove("pos_ind_result", "1.0", tk.END); self.results_text.tag_remove("neg_result", "1.0", tk.END)
+                result_tag = RESULT_TEXT_TAGS.get(result_key)
+                if result_tag: self.results_text.tag_add(result_tag, f"{result_line_index}.0", f"{result_line_index}.end")
                 self.results_text.config(state='disabled');
                 if REPORTLAB_AVAILABLE: self.export_pdf_button.config(state=tk.NORMAL)
                 if OPENPYXL_AVAILABLE: self.export_excel_button.config(state=tk.NORMAL)
@@ -402,15 +875,11 @@ class QFTApp:
                 except (tk.TclError, NameError): pass
 
     def format_results_text(self, r):
-        """Formats the results dictionary for the main text widget."""
-        header = "="*70+"\n"; header += f" Sample ID: {r.get('sample_id', 'N/A')} | Run ID: {r.get('run_id', 'N/A')} | Operator ID: {r.get('operator_id', 'N/A')}\n"; header += "-"*70+"\n\n"
-        table = f"{'Parameter':<15} | {'Input (IU/mL)':<15} | {'Calculated Value':<30}\n"; table += "-"*70+"\n"
-        table += f"{'Nil':<15} | {r.get('input_nil', 0.0):<15.3f} | {'25% of Nil:':<14} {r.get('nil_25', 0.0):<15.4f}\n"; table += f"{'TB1':<15} | {r.get('input_tb1', 0.0):<15.3f} | {'TB1 - Nil:':<14} {r.get('tb1_nil', 0.0):<15.4f}\n"
-        table += f"{'TB2':<15} | {r.get('input_tb2', 0.0):<15.3f} | {'TB2 - Nil:':<14} {r.get('tb2_nil', 0.0):<15.4f}\n"; table += f"{'Mitogen':<15} | {r.get('input_mit', 0.0):<15.3f} | {'Mit - Nil:':<14} {r.get('mit_nil', 0.0):<15.4f}\n"; table += "-"*70+"\n"
-        table += f"{'QFT RESULT':<15} | {r.get('result', 'Error'):<53}\n"
-        if r.get('reason'): table += f"{'Reason':<15} | {r.get('reason', ''):<53}\n"
-        table += "="*70+"\n"; table += "*IND: Indeterminate; †POS: Positive; NEG: Negative\n"; table += "Note: Refer to Flowchart (Help Menu). Clinical correlation required.\n"
-        return header + table
+        """Formats the results dictionary for the main text widget. Returns (text, 1-based line number of the QFT RESULT line)."""
+        reason = r.get('reason'); reason_line = f"{'Reason':<15} | {reason:<53}\n" if reason else ""
+        text = RESULTS_TEXT_TEMPLATE.format(sample_id=r.get('sample_id', 'N/A'), run_id=r.get('run_id', 'N/A'), operator_id=r.get('operator_id', 'N/A'), input_nil=r.get('input_nil', 0.0), input_tb1=r.get('input_tb1', 0.0), input_tb2=r.get('input_tb2', 0.0), input_mit=r.get('input_mit', 0.0),
+                                            nil_25=r.get('nil_25', 0.0), tb1_nil=r.get('tb1_nil', 0.0), tb2_nil=r.get('tb2_nil', 0.0), mit_nil=r.get('mit_nil', 0.0), result=r.get('result', 'Error'), reason_line=reason_line)
+        return text, RESULTS_TEXT_RESULT_LINE
 
     def copy_summary_to_clipboard(self):
         """Copies the content of the results text area to the clipboard."""
@@ -422,20 +891,18 @@ class QFTApp:
         """Exports the CURRENT SINGLE result to a PDF file."""
         if not REPORTLAB_AVAILABLE: messagebox.showerror("PDF Export Error", "ReportLab library not installed."); return
         if not self.last_results: messagebox.showwarning("Export Error", "No results available for current sample."); return
-        r=self.last_results; timestamp=datetime.now().strftime("%Y%m%d_%H%M%S"); safe_sample_id="".join(c if c.isalnum() else"_" for c in r['sample_id']); suggested_filename=f"QFT_Result_{safe_sample_id}_{timestamp}.pdf"
+        r=self.last_results; timestamp=datetime.now().strftime("%Y%m%d_%H%M%S"); safe_sample_id=SAFE_FILENAME_CHAR_RE.sub("_", r['sample_id']); suggested_filename=f"QFT_Result_{safe_sample_id}_{timestamp}.pdf"
         filepath = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Documents", "*.pdf")], initialfile=suggested_filename, title="Save QFT Result as PDF")
         if not filepath: self.set_status("PDF Export Cancelled."); return
-        self.set_status("Exporting PDF...")
+        self.set_status("Exporting PDF...", refresh=True)
         try:
-            doc = SimpleDocTemplate(filepath, pagesize=(8.5*inch, 11*inch), leftMargin=0.75*inch, rightMargin=0.75*inch, topMargin=0.75*inch, bottomMargin=0.75*inch); styles = getSampleStyleSheet(); story = []
+            self._build_pdf_styles()
+            doc = SimpleDocTemplate(filepath, pagesize=(8.5*inch, 11*inch), leftMargin=0.75*inch, rightMargin=0.75*inch, topMargin=0.75*inch, bottomMargin=0.75*inch); styles = self._pdf_styles; story = []
             story.append(Paragraph("LIAISON® QuantiFERON-TB® Gold Plus Interpretation Report", styles['h1'])); story.append(Spacer(1, 0.1*inch)); story.append(Paragraph(f"<b>Sample ID:</b> {r['sample_id']}", styles['h3'])); story.append(Paragraph(f"<b>Run ID:</b> {r.get('run_id', 'N/A')}", styles['Normal'])); story.append(Paragraph(f"<b>Operator ID:</b> {r['operator_id']}", styles['Normal'])); story.append(Spacer(1, 0.1*inch)); story.append(Paragraph(f"Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])); story.append(Spacer(1, 0.2*inch))
-            data=[['Parameter','Input (IU/mL)','Calculated Value',''],['Nil',f"{r['input_nil']:.3f}",'25% of Nil:',f"{r['nil_25']:.4f}"],['TB Antigen 1 (TB1)',f"{r['input_tb1']:.3f}",'TB1 - Nil:',f"{r['tb1_nil']:.4f}"],['TB Antigen 2 (TB2)',f"{r['input_tb2']:.3f}",'TB2 - Nil:',f"{r['tb2_nil']:.4f}"],['Mitogen (Mit)',f"{r['input_mit']:.3f}",'Mit - Nil:',f"{r['mit_nil']:.4f}"]]; table=Table(data, colWidths=[1.5*inch,1.5*inch,1.5*inch,1.5*inch]); table.setStyle(TableStyle([('BACKGROUND',(0,0),(-1,0),colors.grey),('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),('ALIGN',(0,0),(-1,-1),'CENTER'),('VALIGN',(0,0),(-1,-1),'MIDDLE'),('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),('BOTTOMPADDING',(0,0),(-1,0),12),('BACKGROUND',(0,1),(-1,-1),colors.beige),('GRID',(0,0),(-1,-1),1,colors.black),('FONTSIZE',(0,0),(-1,-1),10),('ALIGN',(1,1),(1,-1),'RIGHT'),('ALIGN',(3,1),(3,-1),'RIGHT'),('RIGHTPADDING',(1,1),(1,-1),10),('RIGHTPADDING',(3,1),(3,-1),10)])); story.append(table); story.append(Spacer(1, 0.3*inch))
-            res_style=styles['h2'];
-            if "IND" in r['result'] or "POS" in r['result']: res_style.textColor = colors.red
-            elif "NEG" in r['result']: res_style.textColor = colors.darkgreen
-            else: res_style.textColor = colors.black
+            data=[['Parameter','Input (IU/mL)','Calculated Value',''],['Nil',f"{r['input_nil']:.3f}",'25% of Nil:',f"{r['nil_25']:.4f}"],['TB Antigen 1 (TB1)',f"{r['input_tb1']:.3f}",'TB1 - Nil:',f"{r['tb1_nil']:.4f}"],['TB Antigen 2 (TB2)',f"{r['input_tb2']:.3f}",'TB2 - Nil:',f"{r['tb2_nil']:.4f}"],['Mitogen (Mit)',f"{r['input_mit']:.3f}",'Mit - Nil:',f"{r['mit_nil']:.4f}"]]; table=Table(data, colWidths=[1.5*inch,1.5*inch,1.5*inch,1.5*inch]); table.setStyle(self._pdf_table_styles['result']); story.append(table); story.append(Spacer(1, 0.3*inch))
+            res_style = styles[PDF_RESULT_STYLES.get(_result_code(r['result']), 'ResultDefault')] # Derived from h2; the shared h2 style is never mutated
             story.append(Paragraph(f"QFT RESULT: {r['result']}", res_style)); story.append(Spacer(1, 0.1*inch)); story.append(Paragraph(f"Reason: {r['reason']}", styles['Normal'])); story.append(Spacer(1, 0.3*inch))
-            disclaimer_style=styles['Italic']; disclaimer_style.fontSize=9; story.append(Paragraph("Disclaimer: This report was generated using an automated tool based on the manufacturer's algorithm (Figure 1 - Viewable via Help Menu). Results should always be interpreted in the context of the patient's clinical information, risk factors, and other diagnostic findings. This tool does not replace professional medical judgment.", disclaimer_style))
+            disclaimer_style=styles['Disclaimer']; story.append(Paragraph("Disclaimer: This report was generated using an automated tool based on the manufacturer's algorithm (Figure 1 - Viewable via Help Menu). Results should always be interpreted in the context of the patient's clinical information, risk factors, and other diagnostic findings. This tool does not replace professional medical judgment.", disclaimer_style))
             doc.build(story); messagebox.showinfo("Export Successful", f"Results exported to:\n{filepath}"); self.set_status("PDF Export Successful.")
         except PermissionError: messagebox.showerror("Export Error", f"Permission denied: {filepath}"); self.set_status("Error: PDF Permission Denied.")
         except Exception as e: messagebox.showerror("PDF Export Error", f"Error creating PDF:\n{e}"); log_event("ERROR", details=f"PDF Export failed: {e}\n{traceback.format_exc()}"); self.set_status("Error: PDF Export Failed.")
@@ -444,11 +911,12 @@ class QFTApp:
         """Exports the CURRENT SINGLE result to an Excel file."""
         if not OPENPYXL_AVAILABLE: messagebox.showerror("Excel Export Error", "openpyxl library not installed."); return
         if not self.last_results: messagebox.showwarning("Export Error", "No results available for current sample."); return
-        r = self.last_results; timestamp = datetime.now().strftime("%Y%m%d_%H%M%S"); safe_sample_id="".join(c if c.isalnum() else"_" for c in r['sample_id']); suggested_filename=f"QFT_Result_{safe_sample_id}_{timestamp}.xlsx"
+        r = self.last_results; timestamp = datetime.now().strftime("%Y%m%d_%H%M%S"); safe_sample_id=SAFE_FILENAME_CHAR_RE.sub("_", r['sample_id']); suggested_filename=f"QFT_Result_{safe_sample_id}_{timestamp}.xlsx"
         filepath = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Workbook", "*.xlsx")], initialfile=suggested_filename, title="Save QFT Result as Excel")
         if not filepath: self.set_status("Excel Export Cancelled."); return
-        self.set_status("Exporting Excel...")
+        self.set_status("Exporting Excel...", refresh=True)
         try:
+            _import_openpyxl()
             wb = Workbook(); ws = wb.active; ws.title = "QFT Interpretation"
             header_font=Font(bold=True,size=12); title_font=Font(bold=True,size=14); bold_font=Font(bold=True); center_align=Alignment(horizontal='center',vertical='center'); right_align=Alignment(horizontal='right',vertical='center'); left_align=Alignment(horizontal='left',vertical='top'); wrap_align=Alignment(wrap_text=True,vertical='top'); thin_border_side=Side(border_style="thin",color="000000"); thin_border=Border(left=thin_border_side, right=thin_border_side, top=thin_border_side, bottom=thin_border_side); red_fill=PatternFill(start_color="FFFFC7CE",end_color="FFFFC7CE",fill_type="solid"); green_fill=PatternFill(start_color="FFC6EFCE",end_color="FFC6EFCE",fill_type="solid")
             ws.merge_cells('A1:D1'); ws['A1'] = "LIAISON® QuantiFERON-TB® Gold Plus Interpretation Report"; ws['A1'].font = title_font; ws['A1'].alignment = center_align
@@ -467,11 +935,11 @@ class QFTApp:
                 else: cell.alignment = right_align
             current_row = data_end_row + 2
             ws.cell(row=current_row, column=1, value="QFT RESULT:").font=header_font; ws.merge_cells(start_row=current_row, start_column=2, end_row=current_row, end_column=4); result_cell=ws.cell(row=current_row, column=2, value=r['result']); result_cell.font=bold_font; result_cell.alignment=center_align;
-            if "IND" in r['result'] or "POS" in r['result']: result_cell.fill = red_fill
-            elif "NEG" in r['result']: result_cell.fill = green_fill
+            result_fill = {"POS": red_fill, "IND": red_fill, "NEG": green_fill}.get(_result_code(r['result']))
+            if result_fill: result_cell.fill = result_fill
             current_row += 1; ws.cell(row=current_row, column=1, value="Reason:").font=header_font; ws.merge_cells(start_row=current_row, start_column=2, end_row=current_row, end_column=4); reason_cell=ws.cell(row=current_row, column=2, value=r['reason']); reason_cell.alignment=wrap_align; current_row += 2
             ws.cell(row=current_row, column=1, value="Disclaimer:").font=bold_font; ws.merge_cells(start_row=current_row + 1, start_column=1, end_row=current_row + 3, end_column=4); disclaimer_cell=ws.cell(row=current_row + 1, column=1, value="Disclaimer: This report was generated using an automated tool based on the manufacturer's algorithm (Figure 1 - Viewable via Help Menu). Results should always be interpreted in the context of the patient's clinical information, risk factors, and other diagnostic findings. This tool does not replace professional medical judgment."); disclaimer_cell.font=Font(italic=True, size=9); disclaimer_cell.alignment=wrap_align
-            ws.column_dimensions['A'].width=22; ws.column_dimensions['B'].width=18; ws.column_dimensions['C'].width=18; ws.column_dimensions['D'].width=18
+            _set_column_widths(ws, RESULT_EXCEL_COLUMN_WIDTHS)
             wb.save(filepath); messagebox.showinfo("Export Successful", f"Results exported to:\n{filepath}"); self.set_status("Excel Export Successful.")
         except PermissionError: messagebox.showerror("Export Error", f"Permission denied: {filepath}"); self.set_status("Error: Excel Permission Denied.")
         except Exception as e: messagebox.showerror("Excel Export Error", f"Error creating Excel:\n{e}"); log_event("ERROR", details=f"Excel Export failed: {e}\n{traceback.format_exc()}"); self.set_status("Error: Excel Export Failed.")
@@ -488,8 +956,10 @@ class QFTApp:
         if not PIL_AVAILABLE: messagebox.showerror("Error", "Pillow (PIL) library required."); return
         if not os.path.exists(FLOWCHART_PATH): messagebox.showerror("Error", f"Flowchart image not found:\n{FLOWCHART_PATH}"); return
         try:
-            flowchart_window=tk.Toplevel(self.master); flowchart_window.title("Interpretation Flowchart (Figure 1)"); flowchart_window.transient(self.master)
-            img=Image.open(FLOWCHART_PATH); flowchart_window.image_tk=ImageTk.PhotoImage(img); img_label=tk.Label(flowchart_window,image=flowchart_window.image_tk); img_label.pack(padx=10, pady=10)
+            _import_pil(); flowchart_window=tk.Toplevel(self.master); flowchart_window.title("Interpretation Flowchart (Figure 1)"); flowchart_window.transient(self.master)
+            if self._flowchart_photo is None: # Decode the PNG once per session; later windows reuse the same Tk image
+                with Image.open(FLOWCHART_PATH) as img: self._flowchart_photo = ImageTk.PhotoImage(img)
+            flowchart_window.image_tk=self._flowchart_photo; img_label=tk.Label(flowchart_window,image=flowchart_window.image_tk); img_label.pack(padx=10, pady=10)
             flowchart_window.grab_set(); flowchart_window.focus_set(); flowchart_window.wait_window()
         except Exception as e: messagebox.showerror("Image Error", f"Failed to display flowchart:\n{e}"); log_event("ERROR", details=f"Flowchart display failed: {e}\n{traceback.format_exc()}")
 
@@ -518,17 +988,20 @@ class QFTApp:
         ttk.Label(controls_frame, text="Sample ID:").grid(row=0, column=0, padx=(0,2),pady=5,sticky=tk.W); sample_search_entry = ttk.Entry(controls_frame, width=15); sample_search_entry.grid(row=0, column=1, padx=(0,10),pady=5,sticky=tk.W)
         ttk.Label(controls_frame, text="Run ID:").grid(row=0, column=2, padx=(0,2),pady=5,sticky=tk.W); run_search_entry = ttk.Entry(controls_frame, width=15); run_search_entry.grid(row=0, column=3, padx=(0,10),pady=5,sticky=tk.W)
         ttk.Label(controls_frame, text="Date (YYYY-MM-DD):").grid(row=0, column=4, padx=(0,2),pady=5,sticky=tk.W); date_search_entry = ttk.Entry(controls_frame, width=12); date_search_entry.grid(row=0, column=5, padx=(0,10),pady=5,sticky=tk.W)
-        search_button = ttk.Button(controls_frame, text="Search / Filter", command=lambda: load_history(tv, sample_search_entry.get(), date_search_entry.get(), run_search_entry.get())); search_button.grid(row=0, column=6, padx=5, pady=5)
-        show_all_button = ttk.Button(controls_frame, text="Show All (Recent)", command=lambda: load_history(tv, None, None, None)); show_all_button.grid(row=0, column=7, padx=5, pady=5)
-        close_button = ttk.Button(controls_frame, text="Close", command=history_win.destroy); close_button.grid(row=0, column=8, padx=(20,5), pady=5)
+        history_page = {'filters': (None, None, None), 'after': None} # Filters of the current listing and the key of its last row shown (None: no further page)
+        def show_history_page(filters, append=False):
+            history_page['after'] = load_history(tv, *filters, after=(history_page['after'] if append else None)); history_page['filters'] = filters
+            load_more_button.config(state=(tk.NORMAL if history_page['after'] else tk.DISABLED))
+        search_button = ttk.Button(controls_frame, text="Search / Filter", command=lambda: show_history_page((sample_search_entry.get(), date_search_entry.get(), run_search_entry.get()))); search_button.grid(row=0, column=6, padx=5, pady=5)
+        show_all_button = ttk.Button(controls_frame, text="Show All (Recent)", command=lambda: show_history_page((None, None, None))); show_all_button.grid(row=0, column=7, padx=5, pady=5)
+        load_more_button = ttk.Button(controls_frame, text="Load More", command=lambda: show_history_page(history_page['filters'], append=True), state=tk.DISABLED); load_more_button.grid(row=0, column=8, padx=5, pady=5)
+        close_button = ttk.Button(controls_frame, text="Close", command=history_win.destroy); close_button.grid(row=0, column=9, padx=(20,5), pady=5)
         tree_frame = ttk.Frame(history_win, padding="10"); tree_frame.pack(fill=tk.BOTH, expand=True)
-        columns = ("timestamp", "operator", "run_id", "sample_id", "nil", "tb1", "tb2", "mit", "result", "reason"); tv = ttk.Treeview(tree_frame, columns=columns, show='headings', height=20)
-        tv.heading("timestamp", text="Timestamp", anchor=tk.W); tv.heading("operator", text="Operator", anchor=tk.W); tv.heading("run_id", text="Run ID", anchor=tk.W); tv.heading("sample_id", text="Sample ID", anchor=tk.W); tv.heading("nil", text="Nil", anchor=tk.E); tv.heading("tb1", text="TB1", anchor=tk.E); tv.heading("tb2", text="TB2", anchor=tk.E); tv.heading("mit", text="Mitogen", anchor=tk.E); tv.heading("result", text="Result", anchor=tk.W); tv.heading("reason", text="Reason", anchor=tk.W)
-        tv.column("timestamp", width=140, stretch=tk.NO, anchor=tk.W); tv.column("operator", width=70, stretch=tk.NO, anchor=tk.W); tv.column("run_id", width=100, stretch=tk.NO, anchor=tk.W); tv.column("sample_id", width=120, stretch=tk.NO, anchor=tk.W); tv.column("nil", width=60, stretch=tk.NO, anchor=tk.E); tv.column("tb1", width=60, stretch=tk.NO, anchor=tk.E); tv.column("tb2", width=60, stretch=tk.NO, anchor=tk.E); tv.column("mit", width=60, stretch=tk.NO, anchor=tk.E); tv.column("result", width=70, stretch=tk.NO, anchor=tk.W); tv.column("reason", width=250, stretch=tk.YES, anchor=tk.W)
+        tv = _make_treeview(tree_frame, HISTORY_VIEW_COLUMNS, height=20)
         vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tv.yview); hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=tv.xview); tv.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
         tv.grid(row=0, column=0, sticky='nsew'); vsb.grid(row=0, column=1, sticky='ns'); hsb.grid(row=1, column=0, sticky='ew')
         tree_frame.grid_rowconfigure(0, weight=1); tree_frame.grid_columnconfigure(0, weight=1)
-        load_history(tv, None, None, None); history_win.grab_set(); history_win.focus_set(); history_win.wait_window()
+        show_history_page((None, None, None)); history_win.grab_set(); history_win.focus_set(); history_win.wait_window()
 
         # --- Help/Guide Methods ---
         # --- Help/Guide Methods ---
@@ -617,99 +1090,145 @@ Control-A,9.200,10.00,11.00,15.00"""
     
     # --- Batch Import Methods ---
     def import_batch(self):
-        """Handles batch import."""
+        """Handles batch import: file selection on the UI thread, parsing/interpretation/saving on the background worker."""
         self.show_batch_format_help()
         filepath = filedialog.askopenfilename(title="Select Batch File", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("All files", "*.*")])
         if not filepath: self.set_status("Batch import cancelled."); return
-        self.set_status(f"Importing batch from {os.path.basename(filepath)}...")
         file_extension = os.path.splitext(filepath)[1].lower(); op_id = self.op_id_entry.get().strip() or "N/A"; run_id = self.run_id_entry.get().strip() or "N/A"
-        processed_results = []; skipped_rows = 0; total_rows = 0
-        try:
-            if file_extension == ".csv": processed_results, skipped_rows, total_rows = self._process_csv(filepath, op_id, run_id)
-            elif file_extension == ".xlsx":
-                if not OPENPYXL_AVAILABLE: messagebox.showerror("Import Error", "Openpyxl library required for .xlsx files."); self.set_status("Error: Missing openpyxl."); return
-                processed_results, skipped_rows, total_rows = self._process_excel(filepath, op_id, run_id)
-            else: messagebox.showerror("Import Error", f"Unsupported file type: {file_extension}"); self.set_status("Error: Unsupported file type."); return
-            if processed_results or skipped_rows > 0: self.show_batch_results_window(processed_results, skipped_rows, total_rows, os.path.basename(filepath)); self.set_status(f"Batch Import Finished: {len(processed_results)} processed, {skipped_rows} skipped.")
-            else: messagebox.showinfo("Batch Import", "No valid data rows found or processed."); self.set_status("Batch Import Finished: No valid data.")
-        except Exception as e: messagebox.showerror("Batch Import Error", f"Error during batch processing:\n{e}"); self.set_status("Error during batch import."); log_event("ERROR", details=f"Batch Import failed: {e}\n{traceback.format_exc()}")
+        if file_extension == ".xlsx" and not OPENPYXL_AVAILABLE: messagebox.showerror("Import Error", "Openpyxl library required for .xlsx files."); self.set_status("Error: Missing openpyxl."); return
+        if file_extension not in (".csv", ".xlsx"): messagebox.showerror("Import Error", f"Unsupported file type: {file_extension}"); self.set_status("Error: Unsupported file type."); return
+        self.set_status(f"Importing batch from {os.path.basename(filepath)}..."); self._batch_button_states = (self.interpret_button.cget('state'), self.import_button.cget('state')) # Saved once per batch, restored by _restore_batch_buttons
+        self.interpret_button.config(state=tk.DISABLED); self.import_button.config(state=tk.DISABLED); self.is_processing = True # Also blocks the Mitogen <Return> binding: its delta check would wait on the batch's DB transaction
+        self._run_in_background(self._do_batch_import, filepath, file_extension, op_id, run_id, on_success=lambda outcome: self._apply_batch_results(outcome, os.path.basename(filepath)), on_error=self._batch_import_failed)
+
+    def _do_batch_import(self, filepath, file_extension, op_id, run_id):
+        """Worker-thread body of import_batch: parses, interprets and saves the batch. Must not touch Tk widgets."""
+        # Phases run back to back over the whole batch: parse/validate + classify (chunked), then persist-all, then log-all
+        if file_extension == ".csv": processed_results, skipped_rows, total_rows = self._process_csv(filepath, op_id, run_id)
+        else: processed_results, skipped_rows, total_rows = self._process_excel(filepath, op_id, run_id)
+        save_ok = save_interpretations_bulk(processed_results, show_errors=False) if processed_results else True
+        log_interpretations_bulk(processed_results)
+        return processed_results, skipped_rows, total_rows, save_ok
+
+    def _apply_batch_results(self, outcome, filename):
+        """Main-thread completion of import_batch: shows the results window."""
+        processed_results, skipped_rows, total_rows, save_ok = outcome; self._restore_batch_buttons()
+        if not save_ok: messagebox.showerror("Database Error", f"Failed to save {len(processed_results)} batch results to history.")
+        if processed_results or skipped_rows > 0:
+            status_msg = f"Batch Import Finished: {len(processed_results)} processed, {skipped_rows} skipped."
+            self.set_status(status_msg if save_ok else "Warning: Failed to save batch to history DB. " + status_msg); self.show_batch_results_window(processed_results, skipped_rows, total_rows, filename)
+        else: messagebox.showinfo("Batch Import", "No valid data rows found or processed."); self.set_status("Batch Import Finished: No valid data.")
+
+    def _batch_import_failed(self, e):
+        """Main-thread error handler for import_batch."""
+        self._restore_batch_buttons(); messagebox.showerror("Batch Import Error", f"Error during batch processing:\n{e}"); self.set_status("Error during batch import."); log_event("ERROR", details=f"Batch Import failed: {e}\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}")
+
+    def _restore_batch_buttons(self):
+        """Restores the interpret/import button states saved by import_batch and allows single interpretations again."""
+        interpret_state, import_state = getattr(self, '_batch_button_states', (tk.NORMAL, tk.NORMAL)); self.is_processing = False
+        try: self.interpret_button.config(state=interpret_state); self.import_button.config(state=import_state)
+        except tk.TclError: pass
 
     def _parse_header(self, header_row):
-        """Parses batch header."""
-        header_map = {}; found_headers = set(); lowered_headers = [str(h).strip().lower() if h is not None else '' for h in header_row]
-        for i, header in enumerate(lowered_headers):
-            if header == 'sample id': header_map['sample_id'] = i; found_headers.add('sample id')
-            elif header == 'nil': header_map['nil'] = i; found_headers.add('nil')
-            elif header == 'tb1': header_map['tb1'] = i; found_headers.add('tb1')
-            elif header == 'tb2': header_map['tb2'] = i; found_headers.add('tb2')
-            elif header == 'mitogen': header_map['mitogen'] = i; found_headers.add('mitogen')
-        missing_headers = REQUIRED_BATCH_HEADERS - found_headers
-        if missing_headers: messagebox.showerror("Header Error", f"Missing headers:\n{', '.join(sorted(list(missing_headers)))}"); return None
-        return header_map
-
-    def _process_row_data(self, row_values, header_map, op_id, run_id, row_num):
-        """Processes single batch row."""
+        """Parses batch header. Returns the column indices in BATCH_HEADER_ORDER, or None if required headers are missing."""
+        column_indices, missing_headers = _batch_column_indices(tuple(str(h).strip().lower() if h is not None else '' for h in header_row))
+        if missing_headers: self._post_to_ui(messagebox.showerror, "Header Error", f"Missing headers:\n{', '.join(missing_headers)}"); return None
+        return column_indices
+
+    def _process_row_data(self, row_values, column_indices, op_id, run_id, row_num):
+        """Validates single batch row (column_indices as returned by _parse_header). Returns the input dict, or None if the row is skipped."""
         try:
-            sample_id = str(row_values[header_map['sample_id']]).strip(); nil_str = str(row_values[header_map['nil']]).strip(); tb1_str = str(row_values[header_map['tb1']]).strip(); tb2_str = str(row_values[header_map['tb2']]).strip(); mit_str = str(row_values[header_map['mitogen']]).strip()
-            if not sample_id: print(f"Skipping row {row_num}: Missing Sample ID.", file=sys.stderr); return None
+            idx_sample, idx_nil, idx_tb1, idx_tb2, idx_mit = column_indices
+            sample_id = str(row_values[idx_sample]).strip(); nil_str = str(row_values[idx_nil]).strip(); tb1_str = str(row_values[idx_tb1]).strip(); tb2_str = str(row_values[idx_tb2]).strip(); mit_str = str(row_values[idx_mit]).strip()
+            if not sample_id: batch_logger.warning("Skipping row %d: Missing Sample ID.", row_num); return None
             try: nil_val = float(nil_str); tb1_val = float(tb1_str); tb2_val = float(tb2_str); mit_val = float(mit_str)
-            except (ValueError, TypeError): print(f"Skipping row {row_num} (Sample: {sample_id}): Invalid numeric data.", file=sys.stderr); return None
-            input_data = {'operator_id': op_id, 'run_id': run_id, 'sample_id': sample_id, 'nil': nil_val, 'tb1': tb1_val, 'tb2': tb2_val, 'mitogen': mit_val}
-            result_dict = self.run_interpretation(input_data=input_data); return result_dict
-        except IndexError: print(f"Skipping row {row_num}: Too few columns.", file=sys.stderr); return None
-        except Exception as e: print(f"Error processing row {row_num}: {e}", file=sys.stderr); log_event("ERROR", sample_id=sample_id if 'sample_id' in locals() else 'N/A', details=f"Batch row processing error: {e}\n{traceback.format_exc()}"); return None
-
-    def _process_csv(self, filepath, op_id, run_id):
-        """Processes CSV."""
-        processed_results = []; skipped = 0; row_num = 0; header_map = None
-        with open(filepath, 'r', newline='', encoding='utf-8-sig') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
+            except (ValueError, TypeError): batch_logger.warning("Skipping row %d (Sample: %s): Invalid numeric data.", row_num, sample_id); return None
+            return {'operator_id': op_id, 'run_id': run_id, 'sample_id': sample_id, 'nil': nil_val, 'tb1': tb1_val, 'tb2': tb2_val, 'mitogen': mit_val}
+        except IndexError: batch_logger.warning("Skipping row %d: Too few columns.", row_num); return None
+        except Exception as e: batch_logger.error("Error processing row %d: %s", row_num, e); log_event("ERROR", sample_id=sample_id if 'sample_id' in locals() else 'N/A', details=f"Batch row processing error: {e}\n{traceback.format_exc()}"); return None
+
+    def _interpret_batch(self, batch_inputs):
+        """Interprets validated batch rows in one vectorized pass (no I/O; _do_batch_import saves and logs the whole batch)."""
+        if not batch_inputs: return []
+        results = interpret_qft_batch(*zip(*map(_BATCH_VALUE_COLUMNS, batch_inputs))) # Transpose rows into nil/tb1/tb2/mit columns in one pass
+        for r, d in zip(results, batch_inputs): r["sample_id"]=d['sample_id']; r["operator_id"]=d['operator_id']; r["run_id"]=d['run_id']
+        return results
+
+    def _process_batch_rows(self, rows, op_id, run_id, is_blank):
+        """Streams batch rows (header row first) through validation and the vectorized interpreter in chunks of BATCH_CHUNK_SIZE."""
+        header_row = next(rows, None)
+        if header_row is None: return [], 0, 0
+        column_indices = self._parse_header(header_row)
+        if column_indices is None: return [], 0, 0
+        processed_results = []; skipped = 0; row_num = 1; process_row = self._process_row_data # Bound once for the per-row loop
+        for chunk in iter(lambda: list(itertools.islice(rows, BATCH_CHUNK_SIZE)), []):
+            batch_inputs = []; add_input = batch_inputs.append
+            for row in chunk:
                 row_num += 1
-                if row_num == 1: header_map = self._parse_header(row);
-                if header_map is None and row_num == 1: return [], 0, 0
-                elif header_map and row_num > 1:
-                    if not any(row): continue
-                    result = self._process_row_data(row, header_map, op_id, run_id, row_num)
-                    if result: processed_results.append(result)
-                    else: skipped += 1
+                if is_blank(row): continue
+                input_data = process_row(row, column_indices, op_id, run_id, row_num)
+                if input_data: add_input(input_data)
+                else: skipped += 1
+            processed_results.extend(self._interpret_batch(batch_inputs)); self._post_to_ui(self.set_status, f"Importing batch... {row_num - 1} rows read.")
         return processed_results, skipped, max(0, row_num -1)
 
+    def _process_frame(self, df, op_id, run_id):
+        """Interprets a batch parsed by pandas (all cells as str, header row first): validation and numeric conversion are vectorized.
+        Cells pandas cannot convert are re-checked by _process_row_data, so skips and accepted values match the csv path."""
+        column_indices = self._parse_header(df.iloc[0].tolist())
+        if column_indices is None: return [], 0, 0
+        df = df.iloc[1:]
+        total_rows = len(df); skipped = 0
+        blank = (df == '').all(axis=1).to_numpy() # Same rule as the csv path: every cell empty
+        sample_ids = df.iloc[:, column_indices[0]].str.strip().to_numpy(dtype=object)
+        values = [pd.to_numeric(df.iloc[:, i].str.strip(), errors='coerce').to_numpy(dtype=np.float64, copy=True) for i in column_indices[1:]] # Writable: rescued rows are filled in below
+        valid = ~blank & (sample_ids != '') & ~np.isnan(values).any(axis=0)
+        for i in np.flatnonzero(~blank & ~valid).tolist(): # Rare: missing IDs, bad numbers, or values like "nan" that float() accepts
+            input_data = self._process_row_data(df.iloc[i].tolist(), column_indices, op_id, run_id, i + 2)
+            if input_data is None: skipped += 1; continue
+            for column, key in zip(values, ('nil', 'tb1', 'tb2', 'mitogen')): column[i] = input_data[key]
+            valid[i] = True
+        valid_rows = np.flatnonzero(valid); processed_results = []
+        for start in range(0, valid_rows.shape[0], BATCH_CHUNK_SIZE):
+            rows = valid_rows[start:start + BATCH_CHUNK_SIZE]; results = interpret_qft_batch(*(column[rows] for column in values))
+            for r, sample_id in zip(results, sample_ids[rows].tolist()): r["sample_id"]=sample_id; r["operator_id"]=op_id; r["run_id"]=run_id
+            processed_results.extend(results)
+            self._post_to_ui(self.set_status, f"Importing batch... {start + rows.shape[0]} of {valid_rows.shape[0]} valid rows interpreted.")
+        return processed_results, skipped, total_rows
+
+    def _process_csv(self, filepath, op_id, run_id):
+        """Processes CSV (parsed in C by pandas when available, otherwise streamed through csv.reader)."""
+        if PANDAS_AVAILABLE:
+            try: df = pd.read_csv(filepath, header=None, dtype=str, keep_default_na=False, skip_blank_lines=False, encoding='utf-8-sig') # header=None: pandas would rename repeated headers ('Nil.1'), so the header row goes through _parse_header as on the csv path
+            except pd.errors.EmptyDataError: return [], 0, 0
+            except pd.errors.ParserError as e: print(f"pandas could not parse '{filepath}' ({e}); falling back to csv.reader.", file=sys.stderr)
+            else: return self._process_frame(df, op_id, run_id)
+        with open(filepath, 'r', newline='', encoding='utf-8-sig', buffering=CSV_READ_BUFFER) as csvfile:
+            return self._process_batch_rows(csv.reader(csvfile), op_id, run_id, lambda row: not any(row))
+
     def _process_excel(self, filepath, op_id, run_id):
-        """Processes Excel."""
-        processed_results = []; skipped = 0; row_num = 0; header_map = None; wb = None
+        """Processes Excel row by row from openpyxl's read-only reader (or the sheet XML directly when "fast_xlsx_import" is enabled in the config)."""
+        sheet_rows = _stream_xlsx_rows(filepath) if self.config.get("fast_xlsx_import") else _openpyxl_sheet_rows(filepath)
         try:
-            wb = load_workbook(filename=filepath, read_only=True, data_only=True); ws = wb.active
-            for row in ws.iter_rows():
-                row_num += 1; row_values = [cell.value if cell.value is not None else '' for cell in row]
-                if row_num == 1: header_map = self._parse_header(row_values);
-                if header_map is None and row_num == 1: return [], 0, 0
-                elif header_map and row_num > 1:
-                     if not any(str(v).strip() for v in row_values): continue
-                     result = self._process_row_data(row_values, header_map, op_id, run_id, row_num)
-                     if result: processed_results.append(result)
-                     else: skipped += 1
-        finally:
-            if wb: wb.close()
-        return processed_results, skipped, max(0, row_num -1)
+            rows = ([v if v is not None else '' for v in row] for row in sheet_rows)
+            return self._process_batch_rows(rows, op_id, run_id, _is_blank_sheet_row)
+        finally: sheet_rows.close()
 
     def show_batch_results_window(self, results_list, skipped_count, total_rows, filename):
         """Displays batch results."""
         batch_win = tk.Toplevel(self.master); batch_win.title(f"Batch Import Results: {filename}"); batch_win.geometry("1000x650"); batch_win.transient(self.master)
         summary_frame = ttk.Frame(batch_win, padding="10"); summary_frame.pack(fill=tk.X, side=tk.TOP); summary_text = f"Processed: {len(results_list)} / {total_rows} rows. Skipped: {skipped_count} rows."; ttk.Label(summary_frame, text=summary_text, font=('Segoe UI', 10, 'bold')).pack(side=tk.LEFT)
         pdf_batch_button = ttk.Button(summary_frame, text="Export Batch PDF", command=lambda: self.export_batch_pdf(results_list, filename), state=(tk.NORMAL if REPORTLAB_AVAILABLE and results_list else tk.DISABLED)); pdf_batch_button.pack(side=tk.RIGHT, padx=5)
-        excel_batch_button = ttk.Button(summary_frame, text="Export Batch Excel", command=lambda: self.export_batch_excel(results_list, filename), state=(tk.NORMAL if OPENPYXL_AVAILABLE and results_list else tk.DISABLED)); excel_batch_button.pack(side=tk.RIGHT, padx=5)
+        excel_batch_button = ttk.Button(summary_frame, text="Export Batch Excel", command=lambda: self.export_batch_excel(results_list, filename), state=(tk.NORMAL if (XLSXWRITER_AVAILABLE or OPENPYXL_AVAILABLE) and results_list else tk.DISABLED)); excel_batch_button.pack(side=tk.RIGHT, padx=5)
         close_button = ttk.Button(summary_frame, text="Close Results", command=batch_win.destroy); close_button.pack(side=tk.RIGHT, padx=5)
         tree_frame = ttk.Frame(batch_win, padding="10"); tree_frame.pack(fill=tk.BOTH, expand=True)
-        columns = ("sample_id", "nil", "tb1", "tb2", "mit", "result", "reason"); tv = ttk.Treeview(tree_frame, columns=columns, show='headings', height=25)
-        tv.heading("sample_id", text="Sample ID", anchor=tk.W); tv.heading("nil", text="Nil", anchor=tk.E); tv.heading("tb1", text="TB1", anchor=tk.E); tv.heading("tb2", text="TB2", anchor=tk.E); tv.heading("mit", text="Mitogen", anchor=tk.E); tv.heading("result", text="Result", anchor=tk.W); tv.heading("reason", text="Reason", anchor=tk.W)
-        tv.column("sample_id", width=150, stretch=tk.NO, anchor=tk.W); tv.column("nil", width=70, stretch=tk.NO, anchor=tk.E); tv.column("tb1", width=70, stretch=tk.NO, anchor=tk.E); tv.column("tb2", width=70, stretch=tk.NO, anchor=tk.E); tv.column("mit", width=70, stretch=tk.NO, anchor=tk.E); tv.column("result", width=80, stretch=tk.NO, anchor=tk.W); tv.column("reason", width=400, stretch=tk.YES, anchor=tk.W)
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tv.yview); hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=tv.xview); tv.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+        tv = _make_treeview(tree_frame, BATCH_VIEW_COLUMNS, height=25)
+        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tv.yview); hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=tv.xview)
         tv.grid(row=0, column=0, sticky='nsew'); vsb.grid(row=0, column=1, sticky='ns'); hsb.grid(row=1, column=0, sticky='ew')
         tree_frame.grid_rowconfigure(0, weight=1); tree_frame.grid_columnconfigure(0, weight=1)
-        if not results_list: tv.insert('', tk.END, values=("No results processed.", "", "", "", "", "", ""))
-        else:
-            for r in results_list: values = (r.get('sample_id',''), f"{r.get('input_nil',0.0):.3f}", f"{r.get('input_tb1',0.0):.3f}", f"{r.get('input_tb2',0.0):.3f}", f"{r.get('input_mit',0.0):.3f}", r.get('result','Error'), r.get('reason','')); tv.insert('', tk.END, values=values)
+        tv.configure(xscrollcommand=hsb.set)
+        if not results_list: tv.insert('', tk.END, values=("No results processed.", "", "", "", "", "", "")); tv.configure(yscrollcommand=vsb.set); return
+        _fill_treeview_paged(tv, vsb, results_list, lambda r: (r.get('sample_id',''), f"{r.get('input_nil',0.0):.3f}", f"{r.get('input_tb1',0.0):.3f}", f"{r.get('input_tb2',0.0):.3f}", f"{r.get('input_mit',0.0):.3f}", r.get('result','Error'), r.get('reason',''))) # Opening the window costs the same for any batch size
 
     # --- Batch Export Methods ---
     def export_batch_pdf(self, results_list, source_filename):
@@ -719,54 +1238,71 @@ Control-A,9.200,10.00,11.00,15.00"""
         timestamp=datetime.now().strftime("%Y%m%d_%H%M%S"); suggested_filename=f"QFT_Batch_{os.path.splitext(source_filename)[0]}_{timestamp}.pdf"
         filepath = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Documents", "*.pdf")], initialfile=suggested_filename, title="Save Batch Results as PDF")
         if not filepath: return
-        self.set_status("Exporting Batch PDF...")
+        self.set_status("Exporting Batch PDF...", refresh=True)
         try:
-            doc = SimpleDocTemplate(filepath, pagesize=(11*inch, 8.5*inch), leftMargin=0.5*inch, rightMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch); styles = getSampleStyleSheet(); story = []
+            self._build_pdf_styles()
+            doc = SimpleDocTemplate(filepath, pagesize=(11*inch, 8.5*inch), leftMargin=0.5*inch, rightMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch); styles = self._pdf_styles; story = []
             story.append(Paragraph("LIAISON® QuantiFERON-TB® Gold Plus - Batch Interpretation Report", styles['h1'])); story.append(Paragraph(f"Source File: {source_filename}", styles['Normal']))
             run_id_batch = results_list[0].get('run_id', 'N/A') if results_list else 'N/A'; story.append(Paragraph(f"Run ID: {run_id_batch}", styles['Normal']))
             story.append(Paragraph(f"Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])); story.append(Spacer(1, 0.2*inch))
             headers = ["Sample ID", "Operator", "Nil", "TB1", "TB2", "Mit", "Result", "Reason"]; col_widths = [1.5*inch, 1.0*inch, 0.7*inch, 0.7*inch, 0.7*inch, 0.7*inch, 0.8*inch, 3.0*inch]
-            table_data = [headers]
-            for r in results_list: row_data = [r.get('sample_id',''), r.get('operator_id',''), f"{r.get('input_nil',0.0):.3f}", f"{r.get('input_tb1',0.0):.3f}", f"{r.get('input_tb2',0.0):.3f}", f"{r.get('input_mit',0.0):.3f}", r.get('result','Error'), Paragraph(r.get('reason',''), styles['Normal'])]; table_data.append(row_data)
-            table = Table(table_data, colWidths=col_widths); table.setStyle(TableStyle([('BACKGROUND',(0,0),(-1,0),colors.grey), ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),('ALIGN',(0,0),(-1,0),'CENTER'), ('VALIGN',(0,0),(-1,-1),'MIDDLE'),('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'), ('FONTSIZE',(0,0),(-1,-1),8),('BOTTOMPADDING',(0,0),(-1,0),10), ('TOPPADDING',(0,0),(-1,0),4),('BACKGROUND',(0,1),(-1,-1),colors.whitesmoke),('GRID',(0,0),(-1,-1),0.5,colors.black),('ALIGN',(2,1),(6,-1),'RIGHT')]))
-            story.append(KeepTogether(table)); story.append(Spacer(1, 0.3*inch))
-            disclaimer_style = styles['Italic']; disclaimer_style.fontSize = 9; story.append(Paragraph("Disclaimer: This report was generated using an automated tool based on the manufacturer's algorithm. Results should always be interpreted in the context of the patient's clinical information, risk factors, and other diagnostic findings. This tool does not replace professional medical judgment.", disclaimer_style))
+            reason_width = col_widths[7] - 12; normal_style = styles['Normal']; batch_table_style = self._pdf_table_styles['batch'] # Cell width minus the default left/right padding; styles looked up once, not per row/table
+            for start in range(0, len(results_list), BATCH_PDF_TABLE_ROWS): # Several split-able tables instead of one KeepTogether table; reasons that fit on one line stay plain strings (same 10pt Helvetica as the Normal paragraphs)
+                table_data = [headers]
+                for r in results_list[start:start + BATCH_PDF_TABLE_ROWS]: reason = r.get('reason',''); table_data.append([r.get('sample_id',''), r.get('operator_id',''), f"{r.get('input_nil',0.0):.3f}", f"{r.get('input_tb1',0.0):.3f}", f"{r.get('input_tb2',0.0):.3f}", f"{r.get('input_mit',0.0):.3f}", r.get('result','Error'), reason if stringWidth(reason, 'Helvetica', 10) <= reason_width else Paragraph(reason, normal_style)])
+                table = Table(table_data, colWidths=col_widths, repeatRows=1); table.setStyle(batch_table_style); story.append(table)
+            story.append(Spacer(1, 0.3*inch))
+            disclaimer_style = styles['Disclaimer']; story.append(Paragraph("Disclaimer: This report was generated using an automated tool based on the manufacturer's algorithm. Results should always be interpreted in the context of the patient's clinical information, risk factors, and other diagnostic findings. This tool does not replace professional medical judgment.", disclaimer_style))
             doc.build(story); messagebox.showinfo("Export Successful", f"Batch results exported to:\n{filepath}"); self.set_status("Batch PDF Export Successful.")
         except PermissionError: messagebox.showerror("Export Error", f"Permission denied: {filepath}"); self.set_status("Error: Batch PDF Permission Denied.")
         except Exception as e: messagebox.showerror("PDF Export Error", f"Error creating batch PDF:\n{e}"); log_event("ERROR", details=f"Batch PDF Export failed: {e}\n{traceback.format_exc()}"); self.set_status("Error: Batch PDF Export Failed.")
 
     def export_batch_excel(self, results_list, source_filename):
         """Exports a list of batch results to a single Excel file."""
-        if not OPENPYXL_AVAILABLE: messagebox.showerror("Excel Export Error", "openpyxl library not installed."); return
+        if not (XLSXWRITER_AVAILABLE or OPENPYXL_AVAILABLE): messagebox.showerror("Excel Export Error", "openpyxl library not installed."); return
         if not results_list: messagebox.showwarning("Export Error", "No batch results available to export."); return
         timestamp=datetime.now().strftime("%Y%m%d_%H%M%S"); suggested_filename=f"QFT_Batch_{os.path.splitext(source_filename)[0]}_{timestamp}.xlsx"
         filepath = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Workbook", "*.xlsx")], initialfile=suggested_filename, title="Save Batch Results as Excel")
         if not filepath: return
-        self.set_status("Exporting Batch Excel...")
+        self.set_status("Exporting Batch Excel...", refresh=True)
         try:
-            wb = Workbook(); ws = wb.active; ws.title = "QFT Batch Results"
-            header_font=Font(bold=True, size=11); bold_font=Font(bold=True); right_align=Alignment(horizontal='right', vertical='center'); left_align=Alignment(horizontal='left', vertical='top'); wrap_align=Alignment(wrap_text=True, vertical='top'); thin_border_side=Side(border_style="thin", color="000000"); thin_border=Border(left=thin_border_side, right=thin_border_side, top=thin_border_side, bottom=thin_border_side); red_fill=PatternFill(start_color="FFFFC7CE", end_color="FFFFC7CE", fill_type="solid"); green_fill=PatternFill(start_color="FFC6EFCE", end_color="FFC6EFCE", fill_type="solid")
-            ws['A1'] = "LIAISON® QuantiFERON-TB® Gold Plus - Batch Interpretation Report"; ws['A2'] = "Source File:"; ws['B2'] = source_filename; run_id_batch = results_list[0].get('run_id', 'N/A') if results_list else 'N/A'; ws['A3'] = "Run ID:"; ws['B3'] = run_id_batch; ws['A4'] = "Report Generated:"; ws['B4'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S'); ws.cell(row=2,column=1).font=bold_font; ws.cell(row=3,column=1).font=bold_font; ws.cell(row=4,column=1).font=bold_font
-            current_row = 6; headers=["Sample ID","Operator","Nil","TB1","TB2","Mitogen","Result","Reason","Nil-25%","TB1-Nil","TB2-Nil","Mit-Nil"]
-            for col_idx, header in enumerate(headers, 1): cell = ws.cell(row=current_row, column=col_idx, value=header); cell.font = header_font; cell.border = thin_border
-            current_row += 1
-            for r in results_list:
-                ws.cell(row=current_row, column=1, value=r.get('sample_id','')); ws.cell(row=current_row, column=1).alignment=left_align; ws.cell(row=current_row, column=2, value=r.get('operator_id','')); ws.cell(row=current_row, column=2).alignment=left_align
-                ws.cell(row=current_row, column=3, value=r.get('input_nil')).number_format='0.000'; ws.cell(row=current_row, column=3).alignment=right_align; ws.cell(row=current_row, column=4, value=r.get('input_tb1')).number_format='0.000'; ws.cell(row=current_row, column=4).alignment=right_align
-                ws.cell(row=current_row, column=5, value=r.get('input_tb2')).number_format='0.000'; ws.cell(row=current_row, column=5).alignment=right_align; ws.cell(row=current_row, column=6, value=r.get('input_mit')).number_format='0.000'; ws.cell(row=current_row, column=6).alignment=right_align
-                result_cell=ws.cell(row=current_row, column=7, value=r.get('result','Error')); result_cell.alignment=left_align; result_cell.font=bold_font
-                reason_cell=ws.cell(row=current_row, column=8, value=r.get('reason','')); reason_cell.alignment=wrap_align
-                ws.cell(row=current_row, column=9, value=r.get('nil_25')).number_format='0.0000'; ws.cell(row=current_row, column=9).alignment=right_align; ws.cell(row=current_row, column=10, value=r.get('tb1_nil')).number_format='0.0000'; ws.cell(row=current_row, column=10).alignment=right_align
-                ws.cell(row=current_row, column=11, value=r.get('tb2_nil')).number_format='0.0000'; ws.cell(row=current_row, column=11).alignment=right_align; ws.cell(row=current_row, column=12, value=r.get('mit_nil')).number_format='0.0000'; ws.cell(row=current_row, column=12).alignment=right_align
-                for col_idx in range(1, len(headers)+1): ws.cell(row=current_row, column=col_idx).border=thin_border
-                if "IND" in r['result'] or "POS" in r['result']: result_cell.fill=red_fill
-                elif "NEG" in r['result']: result_cell.fill=green_fill
-                current_row += 1
-            ws.column_dimensions['A'].width=20; ws.column_dimensions['B'].width=12; ws.column_dimensions['C'].width=10; ws.column_dimensions['D'].width=10; ws.column_dimensions['E'].width=10; ws.column_dimensions['F'].width=10; ws.column_dimensions['G'].width=10; ws.column_dimensions['H'].width=45; ws.column_dimensions['I'].width=10; ws.column_dimensions['J'].width=10; ws.column_dimensions['K'].width=10; ws.column_dimensions['L'].width=10
-            wb.save(filepath); messagebox.showinfo("Export Successful", f"Batch results exported to:\n{filepath}"); self.set_status("Batch Excel Export Successful.")
+            if XLSXWRITER_AVAILABLE: self._write_batch_excel_xlsxwriter(filepath, results_list, source_filename)
+            else: self._write_batch_excel_openpyxl(filepath, results_list, source_filename)
+            messagebox.showinfo("Export Successful", f"Batch results exported to:\n{filepath}"); self.set_status("Batch Excel Export Successful.")
         except PermissionError: messagebox.showerror("Export Error", f"Permission denied: {filepath}"); self.set_status("Error: Batch Excel Permission Denied.")
         except Exception as e: messagebox.showerror("Excel Export Error", f"Error creating batch Excel:\n{e}"); log_event("ERROR", details=f"Batch Excel Export failed: {e}\n{traceback.format_exc()}"); self.set_status("Error: Batch Excel Export Failed.")
 
+    def _write_batch_excel_xlsxwriter(self, filepath, results_list, source_filename):
+        """Writes the batch results workbook with xlsxwriter in constant_memory mode: each row is flushed to disk as soon as the next one starts."""
+        _import_xlsxwriter()
+        with xlsxwriter.Workbook(filepath, {'constant_memory': True, 'strings_to_numbers': False, 'strings_to_urls': False, 'nan_inf_to_errors': True}) as wb:
+            ws = wb.add_worksheet("QFT Batch Results"); border = {'border': 1, 'border_color': '#000000'}
+            bold_fmt = wb.add_format({'bold': True}); header_fmt = wb.add_format({'bold': True, 'font_size': 11, **border}); text_fmt = wb.add_format({'align': 'left', 'valign': 'top', **border}); reason_fmt = wb.add_format({'text_wrap': True, 'valign': 'top', **border})
+            input_fmt = wb.add_format({'num_format': '0.000', 'align': 'right', 'valign': 'vcenter', **border}); calc_fmt = wb.add_format({'num_format': '0.0000', 'align': 'right', 'valign': 'vcenter', **border})
+            row_formats = lambda **result_fill: (text_fmt, text_fmt, input_fmt, input_fmt, input_fmt, input_fmt, wb.add_format({'align': 'left', 'valign': 'top', 'bold': True, **border, **result_fill}), reason_fmt, calc_fmt, calc_fmt, calc_fmt, calc_fmt)
+            plain_row_formats = row_formats(); red_row_formats = row_formats(pattern=1, bg_color='#FFC7CE'); result_row_formats = {"POS": red_row_formats, "IND": red_row_formats, "NEG": row_formats(pattern=1, bg_color='#C6EFCE')}
+            for col, width in enumerate(BATCH_EXCEL_COLUMN_WIDTHS): ws.set_column(col, col, width)
+            run_id_batch = results_list[0].get('run_id', 'N/A') if results_list else 'N/A' # constant_memory: rows must be written strictly top to bottom
+            ws.write(0, 0, "LIAISON® QuantiFERON-TB® Gold Plus - Batch Interpretation Report"); ws.write(1, 0, "Source File:", bold_fmt); ws.write(1, 1, source_filename); ws.write(2, 0, "Run ID:", bold_fmt); ws.write(2, 1, run_id_batch); ws.write(3, 0, "Report Generated:", bold_fmt); ws.write(3, 1, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            ws.write_row(5, 0, BATCH_EXCEL_HEADERS, header_fmt)
+            for row, r in enumerate(results_list, 6):
+                for col, (value, fmt) in enumerate(zip(_batch_excel_values(r), result_row_formats.get(_result_code(r['result']), plain_row_formats))): ws.write(row, col, value, fmt)
+
+    def _write_batch_excel_openpyxl(self, filepath, results_list, source_filename):
+        """Writes the batch results workbook with openpyxl (write_only: rows are streamed to the file instead of kept as Cell objects)."""
+        _import_openpyxl()
+        wb = Workbook(write_only=True); ws = wb.create_sheet("QFT Batch Results")
+        header_font=Font(bold=True, size=11); bold_font=Font(bold=True); right_align=Alignment(horizontal='right', vertical='center'); left_align=Alignment(horizontal='left', vertical='top'); wrap_align=Alignment(wrap_text=True, vertical='top'); thin_border_side=Side(border_style="thin", color="000000"); thin_border=Border(left=thin_border_side, right=thin_border_side, top=thin_border_side, bottom=thin_border_side); red_fill=PatternFill(start_color="FFFFC7CE", end_color="FFFFC7CE", fill_type="solid"); green_fill=PatternFill(start_color="FFC6EFCE", end_color="FFC6EFCE", fill_type="solid")
+        for column_letter, width in zip("ABCDEFGHIJKL", BATCH_EXCEL_COLUMN_WIDTHS): ws.column_dimensions[column_letter].width = width # Must be set before the first row is written
+        run_id_batch = results_list[0].get('run_id', 'N/A') if results_list else 'N/A'
+        ws.append(["LIAISON® QuantiFERON-TB® Gold Plus - Batch Interpretation Report"]); ws.append([_styled_cell(ws, "Source File:", font=bold_font), source_filename]); ws.append([_styled_cell(ws, "Run ID:", font=bold_font), run_id_batch]); ws.append([_styled_cell(ws, "Report Generated:", font=bold_font), datetime.now().strftime('%Y-%m-%d %H:%M:%S')]); ws.append([])
+        ws.append([_styled_cell(ws, header, font=header_font, border=thin_border) for header in BATCH_EXCEL_HEADERS])
+        text_style=_cell_style(ws, "QFT Text", alignment=left_align, border=thin_border); input_style=_cell_style(ws, "QFT Input", number_format='0.000', alignment=right_align, border=thin_border); calc_style=_cell_style(ws, "QFT Calculated", number_format='0.0000', alignment=right_align, border=thin_border); reason_style=_cell_style(ws, "QFT Reason", alignment=wrap_align, border=thin_border)
+        row_styles=lambda name, **result_fill: (text_style, text_style, input_style, input_style, input_style, input_style, _cell_style(ws, name, alignment=left_align, font=bold_font, border=thin_border, **result_fill), reason_style, calc_style, calc_style, calc_style, calc_style)
+        plain_row_styles=row_styles("QFT Result"); flagged_row_styles=row_styles("QFT Result Flagged", fill=red_fill); result_row_styles={"POS": flagged_row_styles, "IND": flagged_row_styles, "NEG": row_styles("QFT Result Negative", fill=green_fill)} # Every style is registered once, not per cell
+        for r in results_list: ws.append([_styled_cell(ws, value, style) for value, style in zip(_batch_excel_values(r), result_row_styles.get(_result_code(r['result']), plain_row_styles))])
+        wb.save(filepath)
+
     # --- Worklist Methods ---
     def show_worklist_window(self):
         """Creates and shows the worklist manager window."""
@@ -787,15 +1323,14 @@ Control-A,9.200,10.00,11.00,15.00"""
         """Adds Sample ID from entry to worklist."""
         sample_id = entry_widget.get().strip()
         if sample_id:
-            if sample_id not in self.worklist_items: self.worklist_items.append(sample_id); listbox_widget.insert(tk.END, sample_id); entry_widget.delete(0, tk.END); self.set_status(f"'{sample_id}' added to worklist.")
+            if sample_id not in self._worklist_set: self.worklist_items.append(sample_id); self._worklist_set.add(sample_id); listbox_widget.insert(tk.END, sample_id); entry_widget.delete(0, tk.END); self.set_status(f"'{sample_id}' added to worklist.")
             else: messagebox.showwarning("Duplicate", f"'{sample_id}' already in worklist.", parent=entry_widget.winfo_toplevel())
         entry_widget.focus_set()
 
     def _worklist_remove(self, listbox_widget):
         """Removes selected item from worklist."""
         selected_indices = listbox_widget.curselection()
-        if selected_indices: index = selected_indices[0]; sample_id = listbox_widget.get(index); listbox_widget.delete(index);
-        if sample_id in self.worklist_items: self.worklist_items.remove(sample_id); self.set_status(f"'{sample_id}' removed from worklist.")
+        if selected_indices: index = selected_indices[0]; sample_id = listbox_widget.get(index); listbox_widget.delete(index); del self.worklist_items[index]; self._worklist_set.discard(sample_id); self.set_status(f"'{sample_id}' removed from worklist.") # Listbox rows mirror worklist_items
         else: messagebox.showwarning("Selection Error", "Please select a Sample ID to remove.", parent=listbox_widget.winfo_toplevel())
 
     def _worklist_load(self, listbox_widget, worklist_window):
@@ -813,31 +1348,30 @@ Control-A,9.200,10.00,11.00,15.00"""
         ttk.Label(controls_frame, text="Run ID:").grid(row=0, column=2, padx=(0,2),pady=5,sticky=tk.W); log_run_entry = ttk.Entry(controls_frame, width=15); log_run_entry.grid(row=0, column=3, padx=(0,10),pady=5,sticky=tk.W)
         ttk.Label(controls_frame, text="Operator ID:").grid(row=0, column=4, padx=(0,2),pady=5,sticky=tk.W); log_op_entry = ttk.Entry(controls_frame, width=10); log_op_entry.grid(row=0, column=5, padx=(0,10),pady=5,sticky=tk.W)
         ttk.Label(controls_frame, text="Date (YYYY-MM-DD):").grid(row=0, column=6, padx=(0,2),pady=5,sticky=tk.W); log_date_entry = ttk.Entry(controls_frame, width=12); log_date_entry.grid(row=0, column=7, padx=(0,10),pady=5,sticky=tk.W)
-        log_search_button = ttk.Button(controls_frame, text="Search / Filter Log", command=lambda: load_log_data(tv, log_sample_entry.get(), log_run_entry.get(), log_op_entry.get(), log_date_entry.get())); log_search_button.grid(row=0, column=8, padx=5, pady=5)
-        log_refresh_button = ttk.Button(controls_frame, text="Refresh Log", command=lambda: load_log_data(tv, log_sample_entry.get(), log_run_entry.get(), log_op_entry.get(), log_date_entry.get())); log_refresh_button.grid(row=0, column=9, padx=5, pady=5)
+        log_search_button = ttk.Button(controls_frame, text="Search / Filter Log", command=lambda: load_log_data(tv, vsb, log_sample_entry.get(), log_run_entry.get(), log_op_entry.get(), log_date_entry.get())); log_search_button.grid(row=0, column=8, padx=5, pady=5)
+        log_refresh_button = ttk.Button(controls_frame, text="Refresh Log", command=lambda: load_log_data(tv, vsb, log_sample_entry.get(), log_run_entry.get(), log_op_entry.get(), log_date_entry.get())); log_refresh_button.grid(row=0, column=9, padx=5, pady=5)
         log_close_button = ttk.Button(controls_frame, text="Close", command=log_win.destroy); log_close_button.grid(row=0, column=10, padx=(20,5), pady=5)
         tree_frame = ttk.Frame(log_win, padding="10"); tree_frame.pack(fill=tk.BOTH, expand=True)
-        log_columns_ids = [h.lower().replace(' ', '_') for h in LOG_HEADER]; tv = ttk.Treeview(tree_frame, columns=log_columns_ids, show='headings', height=25)
-        for i, col_id in enumerate(log_columns_ids): tv.heading(col_id, text=LOG_HEADER[i], anchor=tk.W)
-        tv.column("timestamp", width=140, stretch=tk.NO, anchor=tk.W); tv.column("operatorid", width=70, stretch=tk.NO, anchor=tk.W); tv.column("runid", width=100, stretch=tk.NO, anchor=tk.W); tv.column("sampleid", width=120, stretch=tk.NO, anchor=tk.W)
-        tv.column("nil", width=60, stretch=tk.NO, anchor=tk.E); tv.column("tb1", width=60, stretch=tk.NO, anchor=tk.E); tv.column("tb2", width=60, stretch=tk.NO, anchor=tk.E); tv.column("mitogen", width=60, stretch=tk.NO, anchor=tk.E)
-        tv.column("result", width=70, stretch=tk.NO, anchor=tk.W); tv.column("reason", width=300, stretch=tk.YES, anchor=tk.W)
+        tv = _make_treeview(tree_frame, LOG_VIEW_COLUMNS, height=25, heading_anchor=tk.W)
         vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tv.yview); hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=tv.xview); tv.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
         tv.grid(row=0, column=0, sticky='nsew'); vsb.grid(row=0, column=1, sticky='ns'); hsb.grid(row=1, column=0, sticky='ew')
         tree_frame.grid_rowconfigure(0, weight=1); tree_frame.grid_columnconfigure(0, weight=1)
-        load_log_data(tv, "", "", "", ""); log_win.grab_set(); log_win.focus_set(); log_win.wait_window()
+        load_log_data(tv, vsb, "", "", "", ""); log_win.grab_set(); log_win.focus_set(); log_win.wait_window()
 
     # --- Self-Test Method ---
     def run_self_test(self):
         """Runs predefined test cases against the interpretation logic."""
         self.set_status("Running Self-Test...")
         results_text = "--- QFT Interpreter Self-Test Results ---\n\n"; passed_count = 0; failed_count = 0
+        try: batch_results = [r['result'] for r in interpret_qft_batch(*zip(*(case[1:5] for case in SELF_TEST_CASES)))] # All cases in one call through the batch-import path (NumPy/Numba when available)
+        except Exception as e: batch_results = [f"ERROR ({e})"] * len(SELF_TEST_CASES)
         for i, (desc, nil, tb1, tb2, mit, expected) in enumerate(SELF_TEST_CASES):
             test_num = i + 1
             try:
                 result_dict = interpret_qft(nil, tb1, tb2, mit); actual = result_dict['result']
-                if actual == expected: status = "PASSED"; passed_count += 1
-                else: status = f"FAILED (Expected: {expected}, Got: {actual})"; failed_count += 1
+                if actual != expected: status = f"FAILED (Expected: {expected}, Got: {actual})"; failed_count += 1
+                elif batch_results[i] != expected: status = f"FAILED (Expected: {expected}, Batch Got: {batch_results[i]})"; failed_count += 1
+                else: status = "PASSED"; passed_count += 1
                 results_text += f"Test {test_num:<2}: {desc:<40} {status}\n"
             except Exception as e: status = f"ERROR ({e})"; failed_count += 1; results_text += f"Test {test_num:<2}: {desc:<40} {status}\n"
         results_text += f"\n--- Summary ---\nPassed: {passed_count}\nFailed/Error: {failed_count}\nTotal: {len(SELF_TEST_CASES)}\n"; log_event("INFO", details=f"Self-Test Executed: {passed_count} Passed, {failed_count} Failed/Error."); self.set_status("Self-Test Complete.")
@@ -847,31 +1381,28 @@ Control-A,9.200,10.00,11.00,15.00"""
 
     # --- Dashboard Methods ---
     def update_dashboard(self):
-        """Queries the DB and updates the dashboard labels."""
+        """Starts a background query of the DB; the dashboard labels are updated when it completes."""
         self.set_status("Updating dashboard...")
         try:
             days_range = int(self.config.get('dashboard_days', 7)); end_date = datetime.now(); start_date = end_date - timedelta(days=days_range - 1)
             start_date_str = start_date.strftime('%Y-%m-%d'); end_date_str = end_date.strftime('%Y-%m-%d')
-            data = query_db_for_reports(start_date_str, end_date_str)
-            total = len(data); pos_count = 0; neg_count = 0; ind_count = 0; ind_reasons = Counter()
-            for row in data:
-                result = row[4]; reason = row[5]
-                if result == "POS†": pos_count += 1
-                elif result == "NEG": neg_count += 1
-                elif result == "IND*":
-                    ind_count += 1
-                    if "High Nil" in reason: ind_reasons["High Nil"] += 1
-                    elif "Low Mitogen" in reason: ind_reasons["Low Mitogen"] += 1
-                    else: ind_reasons["Other"] += 1
-            pos_rate = (pos_count / total * 100) if total > 0 else 0; ind_rate = (ind_count / total * 100) if total > 0 else 0
-            self.dashboard_vars["total"].set(f"Total: {total}"); self.dashboard_vars["pos"].set(f"POS: {pos_count}"); self.dashboard_vars["neg"].set(f"NEG: {neg_count}"); self.dashboard_vars["ind"].set(f"IND: {ind_count}")
-            self.dashboard_vars["ind_high_nil"].set(f"IND (High Nil): {ind_reasons['High Nil']}"); self.dashboard_vars["ind_low_mit"].set(f"IND (Low Mitogen): {ind_reasons['Low Mitogen']}")
-            self.dashboard_vars["pos_rate"].set(f"POS%: {pos_rate:.1f}%"); self.dashboard_vars["ind_rate"].set(f"IND%: {ind_rate:.1f}%")
-            self.dashboard_frame.config(text=f"Dashboard ({start_date_str} to {end_date_str} - {days_range} Days)")
-            self.set_status("Dashboard updated."); # No separate log event for dashboard update
-        except Exception as e:
-            self.set_status("Error updating dashboard."); log_event("ERROR", details=f"Dashboard update failed: {e}\n{traceback.format_exc()}")
-            for key in self.dashboard_vars: self.dashboard_vars[key].set(f"{key.replace('_',' ').title()}: Error")
+        except Exception as e: self._dashboard_failed(e); return
+        self._run_in_background(query_dashboard_counts, start_date_str, end_date_str, read_only=True, on_success=lambda counts: self._apply_dashboard(counts, start_date_str, end_date_str, days_range), on_error=self._dashboard_failed)
+
+    def _apply_dashboard(self, counts, start_date_str, end_date_str, days_range):
+        """Main-thread completion of update_dashboard: updates the dashboard labels."""
+        total, pos_count, neg_count, ind_count, ind_reasons = counts
+        pos_rate = (pos_count / total * 100) if total > 0 else 0; ind_rate = (ind_count / total * 100) if total > 0 else 0
+        self.dashboard_vars["total"].set(f"Total: {total}"); self.dashboard_vars["pos"].set(f"POS: {pos_count}"); self.dashboard_vars["neg"].set(f"NEG: {neg_count}"); self.dashboard_vars["ind"].set(f"IND: {ind_count}")
+        self.dashboard_vars["ind_high_nil"].set(f"IND (High Nil): {ind_reasons['High Nil']}"); self.dashboard_vars["ind_low_mit"].set(f"IND (Low Mitogen): {ind_reasons['Low Mitogen']}")
+        self.dashboard_vars["pos_rate"].set(f"POS%: {pos_rate:.1f}%"); self.dashboard_vars["ind_rate"].set(f"IND%: {ind_rate:.1f}%")
+        self.dashboard_frame.config(text=f"Dashboard ({start_date_str} to {end_date_str} - {days_range} Days)")
+        self.set_status("Dashboard updated."); # No separate log event for dashboard update
+
+    def _dashboard_failed(self, e):
+        """Main-thread error handler for update_dashboard."""
+        self.set_status("Error updating dashboard."); log_event("ERROR", details=f"Dashboard update failed: {e}\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}")
+        for key in self.dashboard_vars: self.dashboard_vars[key].set(f"{key.replace('_',' ').title()}: Error")
 
     # --- Report Generation Window ---
     def show_report_window(self):
@@ -883,26 +1414,30 @@ Control-A,9.200,10.00,11.00,15.00"""
         today = datetime.now(); default_start = today - timedelta(days=self.config.get('dashboard_days', 7) - 1); start_date_entry.insert(0, default_start.strftime('%Y-%m-%d'))
         ttk.Label(frame, text="End Date (YYYY-MM-DD):").grid(row=2, column=0, sticky="w", padx=5, pady=2); end_date_entry = ttk.Entry(frame, width=12); end_date_entry.grid(row=2, column=1, sticky="ew", padx=5, pady=2); end_date_entry.insert(0, today.strftime('%Y-%m-%d'))
         button_frame = ttk.Frame(frame, padding="0 15 0 0"); button_frame.grid(row=3, column=0, columnspan=2, sticky="e")
-        gen_pdf_button = ttk.Button(button_frame, text="Generate PDF Report", command=lambda: self._generate_report('pdf', start_date_entry.get(), end_date_entry.get()), state=(tk.NORMAL if REPORTLAB_AVAILABLE else tk.DISABLED)); gen_pdf_button.pack(side=tk.RIGHT, padx=5)
-        gen_excel_button = ttk.Button(button_frame, text="Generate Excel Report", command=lambda: self._generate_report('excel', start_date_entry.get(), end_date_entry.get()), state=(tk.NORMAL if OPENPYXL_AVAILABLE else tk.DISABLED)); gen_excel_button.pack(side=tk.RIGHT, padx=5)
+        gen_pdf_button = ttk.Button(button_frame, text="Generate PDF Report", command=lambda: self._generate_report('pdf', start_date_entry.get(), end_date_entry.get(), (gen_pdf_button, gen_excel_button)), state=(tk.NORMAL if REPORTLAB_AVAILABLE else tk.DISABLED)); gen_pdf_button.pack(side=tk.RIGHT, padx=5)
+        gen_excel_button = ttk.Button(button_frame, text="Generate Excel Report", command=lambda: self._generate_report('excel', start_date_entry.get(), end_date_entry.get(), (gen_pdf_button, gen_excel_button)), state=(tk.NORMAL if (XLSXWRITER_AVAILABLE or OPENPYXL_AVAILABLE) else tk.DISABLED)); gen_excel_button.pack(side=tk.RIGHT, padx=5)
         report_win.grab_set(); report_win.focus_set(); report_win.wait_window()
 
-    def _generate_report(self, format_type, start_date_str, end_date_str):
-        """Fetches data and generates the summary report."""
-        self.set_status(f"Generating {format_type.upper()} report..."); data = query_db_for_reports(start_date_str, end_date_str)
-        if data is None: self.set_status("Report generation failed (DB query error)."); return
-        if not data: messagebox.showinfo("No Data", f"No records found between {start_date_str} and {end_date_str}.", parent=self.master); self.set_status("Report generation cancelled (no data)."); return
-        total = len(data); pos_count = 0; neg_count = 0; ind_count = 0; ind_reasons = Counter(); run_ids = set(); operators = set();
-        for row in data:
-            timestamp, operator, run_id, sample_id, result, reason = row
-            if operator: operators.add(operator)
-            if run_id: run_ids.add(run_id)
-            if result == "POS†": pos_count += 1
-            elif result == "NEG": neg_count += 1
-            elif result == "IND*": ind_count += 1;
-            if "High Nil" in reason: ind_reasons["High Nil"] += 1
-            elif "Low Mitogen" in reason: ind_reasons["Low Mitogen"] += 1
-            else: ind_reasons["Other"] += 1
+    def _generate_report(self, format_type, start_date_str, end_date_str, report_buttons=()):
+        """Fetches the summary and generates the report: queries and the save dialog on the UI thread, the file itself is written on the background worker (report_buttons are disabled meanwhile)."""
+        self.set_status(f"Generating {format_type.upper()} report...", refresh=True); snapshot = None
+        try:
+            if format_type == 'excel': snapshot = _connect(read_only=True); snapshot.execute("BEGIN") # Summary and streamed detail rows come from one read snapshot (WAL readers never block saves)
+        except sqlite3.Error as e:
+            if snapshot: snapshot.close()
+            messagebox.showerror("Database Error", f"Failed to query history for report:\n{e}"); self.set_status("Report generation failed (DB query error)."); return
+        handed_off = False
+        try: handed_off = self._start_report(snapshot, format_type, start_date_str, end_date_str, report_buttons)
+        finally:
+            if snapshot and not handed_off: snapshot.close() # Once handed off, the worker closes it after the detail rows are written
+
+    def _start_report(self, snapshot, format_type, start_date_str, end_date_str, report_buttons):
+        """UI-thread part of _generate_report; snapshot is the read-only connection the Excel detail rows are streamed from (None for PDF).
+        Returns True once the write is queued on the worker (which then owns snapshot)."""
+        summary = query_report_summary(start_date_str, end_date_str, snapshot) # Totals are aggregated in SQL; rows are only fetched for the Excel detail sheet, as it is written
+        if summary is None: self.set_status("Report generation failed (DB query error)."); return
+        total, pos_count, neg_count, ind_count, ind_reasons, run_count, operator_count = summary
+        if not total: messagebox.showinfo("No Data", f"No records found between {start_date_str} and {end_date_str}.", parent=self.master); self.set_status("Report generation cancelled (no data)."); return
         pos_rate=(pos_count/total*100) if total>0 else 0; neg_rate=(neg_count/total*100) if total>0 else 0; ind_rate=(ind_count/total*100) if total>0 else 0;
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S"); default_filename = f"QFT_Summary_Report_{start_date_str}_to_{end_date_str}_{timestamp}"
         if format_type == 'pdf': file_ext=".pdf"; file_types=[("PDF Documents", "*.pdf")]
@@ -910,91 +1445,220 @@ Control-A,9.200,10.00,11.00,15.00"""
         else: return
         filepath = filedialog.asksaveasfilename(defaultextension=file_ext, filetypes=file_types, initialfile=default_filename, title=f"Save Summary Report as {format_type.upper()}")
         if not filepath: self.set_status("Report export cancelled."); return
-        success = False
+        button_states = []
+        for button in report_buttons: button_states.append((button, button.cget('state'))); button.config(state=tk.DISABLED)
+        self.set_status(f"Writing {format_type.upper()} report...")
+        if format_type == 'pdf': self._build_pdf_styles() # Built here on the Tk thread; the worker only reads them
+        summary_values = (total, pos_count, neg_count, ind_count, pos_rate, neg_rate, ind_rate, ind_reasons, run_count, operator_count)
+        self._run_in_background(self._write_summary_report, snapshot, format_type, filepath, start_date_str, end_date_str, summary_values, on_success=lambda success: self._report_written(success, format_type, filepath, button_states), on_error=lambda e: self._report_failed(e, format_type, button_states))
+        return True
+
+    def _write_summary_report(self, snapshot, format_type, filepath, start_date_str, end_date_str, summary_values):
+        """Worker-thread body of _generate_report: writes the report file (Excel detail rows streamed from snapshot, which is closed here). Must not touch Tk widgets."""
         try:
-            if format_type == 'pdf': success = self._write_summary_pdf(filepath, start_date_str, end_date_str, total, pos_count, neg_count, ind_count, pos_rate, neg_rate, ind_rate, ind_reasons, run_ids, operators)
-            elif format_type == 'excel': success = self._write_summary_excel(filepath, start_date_str, end_date_str, total, pos_count, neg_count, ind_count, pos_rate, neg_rate, ind_rate, ind_reasons, run_ids, operators, data)
-            if success: messagebox.showinfo("Report Generated", f"Summary report saved successfully to:\n{filepath}"); self.set_status(f"{format_type.upper()} Report Generated.")
-        except Exception as e: messagebox.showerror("Report Generation Error", f"Failed to generate {format_type.upper()} report:\n{e}"); log_event("ERROR", details=f"Report Generation ({format_type}) failed: {e}\n{traceback.format_exc()}"); self.set_status(f"Error generating {format_type.upper()} report.")
-
-    def _write_summary_pdf(self, filepath, start_date, end_date, total, pos, neg, ind, pos_r, neg_r, ind_r, ind_reasons, runs, ops):
-        """Helper to write the summary data to a PDF file."""
-        if not REPORTLAB_AVAILABLE: return False
-        try:
-            doc = SimpleDocTemplate(filepath, pagesize=(8.5*inch, 11*inch), leftMargin=0.75*inch, rightMargin=0.75*inch, topMargin=0.75*inch, bottomMargin=0.75*inch); styles = getSampleStyleSheet(); story = []; styles.add(ParagraphStyle(name='RightAlign', alignment=TA_RIGHT)); styles.add(ParagraphStyle(name='Bold', fontName='Helvetica-Bold'))
-            story.append(Paragraph("QFT Interpretation Summary Report", styles['h1'])); story.append(Paragraph(f"Date Range: {start_date} to {end_date}", styles['h3'])); story.append(Paragraph(f"Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])); story.append(Spacer(1, 0.3*inch))
-            summary_data = [[Paragraph('Metric', styles['Bold']), Paragraph('Count / Value', styles['Bold'])],['Total Interpretations:', Paragraph(str(total), styles['RightAlign'])],['Positive Results (POS†):', Paragraph(str(pos), styles['RightAlign'])],['Negative Results (NEG):', Paragraph(str(neg), styles['RightAlign'])],['Indeterminate Results (IND*):', Paragraph(str(ind), styles['RightAlign'])],['    - IND (High Nil):', Paragraph(str(ind_reasons.get("High Nil", 0)), styles['RightAlign'])],['    - IND (Low Mitogen):', Paragraph(str(ind_reasons.get("Low Mitogen", 0)), styles['RightAlign'])],['    - IND (Other):', Paragraph(str(ind_reasons.get("Other", 0)), styles['RightAlign'])],['Positivity Rate:', Paragraph(f"{pos_r:.1f}%", styles['RightAlign'])],['Negativity Rate:', Paragraph(f"{neg_r:.1f}%", styles['RightAlign'])],['Indeterminate Rate:', Paragraph(f"{ind_r:.1f}%", styles['RightAlign'])],['Unique Run IDs:', Paragraph(str(len(runs)), styles['RightAlign'])],['Unique Operators:', Paragraph(str(len(ops)), styles['RightAlign'])]]
-            table = Table(summary_data, colWidths=[3*inch, 1.5*inch]); table.setStyle(TableStyle([('GRID',(0,0),(-1,-1),1,colors.black), ('BACKGROUND',(0,0),(-1,0),colors.grey), ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke), ('ALIGN',(0,0),(-1,0),'CENTER'), ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'), ('BOTTOMPADDING',(0,0),(-1,-1),6), ('TOPPADDING',(0,0),(-1,-1),6), ('ALIGN',(0,1),(0,-1),'LEFT')])); story.append(table)
-            doc.build(story); return True
-        except Exception as e: messagebox.showerror("PDF Write Error", f"Error creating PDF:\n{e}"); log_event("ERROR", details=f"Summary PDF Write failed: {e}\n{traceback.format_exc()}"); return False
-
-    def _write_summary_excel(self, filepath, start_date, end_date, total, pos, neg, ind, pos_r, neg_r, ind_r, ind_reasons, runs, ops, detail_data):
-        """Helper to write the summary data and detail to an Excel file."""
-        if not OPENPYXL_AVAILABLE: return False
-        try:
-            wb = Workbook(); ws_summary = wb.active; ws_summary.title = "Summary"; bold_font=Font(bold=True); right_align=Alignment(horizontal='right')
-            ws_summary['A1'] = "QFT Interpretation Summary Report"; ws_summary['A1'].font = Font(bold=True, size=14); ws_summary['A2'] = "Date Range:"; ws_summary['B2'] = f"{start_date} to {end_date}"; ws_summary['A3'] = "Report Generated:"; ws_summary['B3'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            summary_headers = ["Metric", "Count / Value"]; summary_rows = [("Total Interpretations:", total), ("Positive Results (POS†):", pos), ("Negative Results (NEG):", neg), ("Indeterminate Results (IND*):", ind), ("    - IND (High Nil):", ind_reasons.get("High Nil", 0)), ("    - IND (Low Mitogen):", ind_reasons.get("Low Mitogen", 0)), ("    - IND (Other):", ind_reasons.get("Other", 0)), ("Positivity Rate:", f"{pos_r:.1f}%"), ("Negativity Rate:", f"{neg_r:.1f}%"), ("Indeterminate Rate:", f"{ind_r:.1f}%"), ("Unique Run IDs:", len(runs)), ("Unique Operators:", len(ops))]
-            current_row = 5
-            for col_idx, header in enumerate(summary_headers, 1): ws_summary.cell(row=current_row, column=col_idx, value=header).font = bold_font
-            current_row += 1
-            for metric, value in summary_rows: ws_summary.cell(row=current_row, column=1, value=metric); cell = ws_summary.cell(row=current_row, column=2, value=value); cell.alignment = right_align;
-            if isinstance(value, (int, float)): cell.number_format = '0'
-            else: cell.number_format = '@'; current_row += 1
-            ws_summary.column_dimensions['A'].width = 30; ws_summary.column_dimensions['B'].width = 15
-            ws_detail = wb.create_sheet("Detail"); detail_headers = ["Timestamp", "Operator", "Run ID", "Sample ID", "Result", "Reason"]
-            for col_idx, header in enumerate(detail_headers, 1): ws_detail.cell(row=1, column=col_idx, value=header).font = bold_font
-            for row_idx, data_row in enumerate(detail_data, 2):
-                 for col_idx, cell_value in enumerate(data_row, 1): ws_detail.cell(row=row_idx, column=col_idx, value=cell_value)
-            ws_detail.column_dimensions['A'].width = 20; ws_detail.column_dimensions['B'].width = 15; ws_detail.column_dimensions['C'].width = 15; ws_detail.column_dimensions['D'].width = 20; ws_detail.column_dimensions['E'].width = 10; ws_detail.column_dimensions['F'].width = 50
-            wb.save(filepath); return True
-        except Exception as e: messagebox.showerror("Excel Write Error", f"Error creating Excel:\n{e}"); log_event("ERROR", details=f"Summary Excel Write failed: {e}\n{traceback.format_exc()}"); return False
+            if format_type == 'pdf': return self._write_summary_pdf(filepath, start_date_str, end_date_str, *summary_values)
+            return self._write_summary_excel(filepath, start_date_str, end_date_str, *summary_values, query_db_for_reports(snapshot, start_date_str, end_date_str))
+        finally:
+            if snapshot: snapshot.close()
+
+    def _report_written(self, success, format_type, filepath, button_states):
+        """Main-thread completion of _generate_report."""
+        self._restore_report_buttons(button_states)
+        if success: messagebox.showinfo("Report Generated", f"Summary report saved successfully to:\n{filepath}"); self.set_status(f"{format_type.upper()} Report Generated.")
+        else: self.set_status(f"Error generating {format_type.upper()} report.")
+
+    def _report_failed(self, e, format_type, button_states):
+        """Main-thread error handler for _generate_report."""
+        self._restore_report_buttons(button_states); kind = "PDF" if format_type == 'pdf' else "Excel"
+        messagebox.showerror(f"{kind} Write Error", f"Error creating {kind}:\n{e}"); log_event("ERROR", details=f"Summary {kind} Write failed: {e}\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}"); self.set_status(f"Error generating {format_type.upper()} report.")
+
+    def _restore_report_buttons(self, button_states):
+        """Restores the report window's button states saved by _start_report (the window may have been closed meanwhile)."""
+        for button, state in button_states:
+            try: button.config(state=state)
+            except tk.TclError: pass
+
+    def _write_summary_pdf(self, filepath, start_date, end_date, total, pos, neg, ind, pos_r, neg_r, ind_r, ind_reasons, run_count, operator_count):
+        """Helper to write the summary data to a PDF file. Raises on write errors (runs on the background worker; no Tk calls)."""
+        if not REPORTLAB_AVAILABLE: return False # Styles were built by _start_report on the Tk thread
+        doc = SimpleDocTemplate(filepath, pagesize=(8.5*inch, 11*inch), leftMargin=0.75*inch, rightMargin=0.75*inch, topMargin=0.75*inch, bottomMargin=0.75*inch); styles = self._pdf_styles; story = []
+        story.append(Paragraph("QFT Interpretation Summary Report", styles['h1'])); story.append(Paragraph(f"Date Range: {start_date} to {end_date}", styles['h3'])); story.append(Paragraph(f"Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])); story.append(Spacer(1, 0.3*inch))
+        summary_data = [SUMMARY_METRIC_HEADERS, *((metric, str(value)) for metric, value in _summary_metric_rows(total, pos, neg, ind, pos_r, neg_r, ind_r, ind_reasons, run_count, operator_count))] # Plain strings: fonts and alignment come from the 'summary' TableStyle
+        table = Table(summary_data, colWidths=[3*inch, 1.5*inch]); table.setStyle(self._pdf_table_styles['summary']); story.append(table)
+        doc.build(story); return True
+
+    def _write_summary_excel(self, filepath, start_date, end_date, total, pos, neg, ind, pos_r, neg_r, ind_r, ind_reasons, run_count, operator_count, detail_data):
+        """Helper to write the summary data and detail to an Excel file (xlsxwriter when installed, openpyxl otherwise). detail_data may be any iterable of rows (e.g. a DB cursor); it is consumed once, as the detail sheet is written.
+        Raises on write errors (runs on the background worker; no Tk calls)."""
+        if not (XLSXWRITER_AVAILABLE or OPENPYXL_AVAILABLE): return False
+        summary_rows = _summary_metric_rows(total, pos, neg, ind, pos_r, neg_r, ind_r, ind_reasons, run_count, operator_count)
+        if XLSXWRITER_AVAILABLE: self._write_summary_excel_xlsxwriter(filepath, f"{start_date} to {end_date}", summary_rows, detail_data)
+        else: self._write_summary_excel_openpyxl(filepath, f"{start_date} to {end_date}", summary_rows, detail_data)
+        return True
+
+    def _write_summary_excel_xlsxwriter(self, filepath, date_range, summary_rows, detail_data):
+        """Writes the summary workbook with xlsxwriter in constant_memory mode (each row is flushed to disk as soon as the next one starts)."""
+        _import_xlsxwriter()
+        with xlsxwriter.Workbook(filepath, {'constant_memory': True, 'strings_to_numbers': False, 'strings_to_urls': False}) as wb:
+            title_fmt = wb.add_format({'bold': True, 'font_size': 14}); bold_fmt = wb.add_format({'bold': True}); count_fmt = wb.add_format({'num_format': '0', 'align': 'right'}); text_fmt = wb.add_format({'num_format': '@', 'align': 'right'})
+            ws_summary = wb.add_worksheet("Summary") # constant_memory: rows must be written strictly top to bottom
+            for column_letter, width in SUMMARY_EXCEL_COLUMN_WIDTHS.items(): ws_summary.set_column(f"{column_letter}:{column_letter}", width)
+            ws_summary.write(0, 0, "QFT Interpretation Summary Report", title_fmt); ws_summary.write_row(1, 0, ("Date Range:", date_range)); ws_summary.write_row(2, 0, ("Report Generated:", datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            ws_summary.write_row(4, 0, SUMMARY_METRIC_HEADERS, bold_fmt)
+            for row, (metric, value) in enumerate(summary_rows, 5): ws_summary.write(row, 0, metric); ws_summary.write(row, 1, value, count_fmt if isinstance(value, (int, float)) else text_fmt)
+            ws_detail = wb.add_worksheet("Detail")
+            for column_letter, width in SUMMARY_DETAIL_COLUMN_WIDTHS.items(): ws_detail.set_column(f"{column_letter}:{column_letter}", width)
+            ws_detail.write_row(0, 0, SUMMARY_DETAIL_HEADERS, bold_fmt); write_row = ws_detail.write_row
+            for row, data_row in enumerate(detail_data, 1): write_row(row, 0, data_row)
+
+    def _write_summary_excel_openpyxl(self, filepath, date_range, summary_rows, detail_data):
+        """Writes the summary workbook with openpyxl (write_only: rows are streamed to the file instead of kept as Cell objects)."""
+        _import_openpyxl()
+        wb = Workbook(write_only=True); ws_summary = wb.create_sheet("Summary"); right_align=Alignment(horizontal='right')
+        bold_style=_cell_style(ws_summary, "QFT Header", font=Font(bold=True)); count_style=_cell_style(ws_summary, "QFT Count", alignment=right_align, number_format='0'); text_style=_cell_style(ws_summary, "QFT Value", alignment=right_align, number_format='@') # Registered once per workbook, shared by both sheets
+        _set_column_widths(ws_summary, SUMMARY_EXCEL_COLUMN_WIDTHS) # Must be set before the first row is written
+        ws_summary.append([_styled_cell(ws_summary, "QFT Interpretation Summary Report", font=Font(bold=True, size=14))]); ws_summary.append(["Date Range:", date_range]); ws_summary.append(["Report Generated:", datetime.now().strftime('%Y-%m-%d %H:%M:%S')]); ws_summary.append([])
+        ws_summary.append([_styled_cell(ws_summary, header, bold_style) for header in SUMMARY_METRIC_HEADERS])
+        for metric, value in summary_rows: ws_summary.append([metric, _styled_cell(ws_summary, value, count_style if isinstance(value, (int, float)) else text_style)])
+        ws_detail = wb.create_sheet("Detail"); _set_column_widths(ws_detail, SUMMARY_DETAIL_COLUMN_WIDTHS)
+        ws_detail.append([_styled_cell(ws_detail, header, bold_style) for header in SUMMARY_DETAIL_HEADERS])
+        for data_row in detail_data: ws_detail.append(data_row)
+        wb.save(filepath)
 
     # --- Window Closing ---
     def on_closing(self):
-        """Handles window closing: saves config."""
+        """Handles window closing: saves config if it changed. Waits for the task running on the worker (a batch only after confirmation) before closing the log and DB."""
+        if self.is_processing and not messagebox.askokcancel("Batch Import Running", "A batch import is still running.\nWait for it to finish saving and then exit?"): return
         current_geometry = self.master.geometry(); self.config['geometry'] = current_geometry; self.config['theme'] = self.current_theme.get()
-        save_config(self.config); log_event("INFO", details="Application Shutdown.")
+        if self.config != self._saved_config: save_config(self.config) # Only write when something changed
+        self.set_status("Finishing background work..."); self.master.update_idletasks()
+        for future, _, _ in self._pending_saves: future.cancel() # Queued saves are written below instead (no shutdown(cancel_futures=...): that needs Python 3.9)
+        self._executor.shutdown(wait=True) # The running task may still be saving/logging
+        log_event("INFO", details="Application Shutdown.")
+        for future, results_dict, timestamp in self._pending_saves:
+            if future.cancelled(): save_interpretations_bulk([results_dict], show_errors=False, timestamp=timestamp) # Never started on the worker; write it now
+        close_log(); close_db()
         self.master.destroy()
 
 
 # --- History & Log Loading Functions (outside class) ---
-def load_history(treeview, search_id=None, search_date=None, search_run_id=None):
-    """Loads data into the history Treeview, optionally filtering."""
-    for item in treeview.get_children(): treeview.delete(item); conn = None
+def _format_history_value(value):
+    """Formats a stored Nil/TB1/TB2/Mitogen value for the history view: 3 decimals, "" for NULL, text as-is if it is not numeric (REAL columns are checked first, without a try)."""
+    if value.__class__ is float: return f"{value:.3f}"
+    if value is None: return ""
+    try: return f"{float(value):.3f}"
+    except (TypeError, ValueError): return str(value)
+
+def load_history(treeview, search_id=None, search_date=None, search_run_id=None, after=None):
+    """Loads one page (HISTORY_PAGE_SIZE rows, newest first) into the history Treeview, optionally filtering.
+    after=None replaces the listing; passing the key returned by the previous call appends the next page (keyset pagination: each page is an index seek, not an OFFSET scan).
+    Returns the (timestamp, id) key of the last row when the page was full (more rows may follow), else None."""
+    if after is None: treeview.delete(*treeview.get_children()) # One Tcl call instead of one per item
     try:
-        conn = sqlite3.connect(DB_FILENAME); cursor = conn.cursor(); query = "SELECT timestamp, operator_id, run_id, sample_id, nil_value, tb1_value, tb2_value, mit_value, result, reason FROM interpretations"; params = []; conditions = []
+        query = "SELECT id, timestamp, operator_id, run_id, sample_id, nil_value, tb1_value, tb2_value, mit_value, result, reason FROM interpretations"; params = []; conditions = []
         effective_search_id = search_id.strip() if search_id else None; effective_search_date = search_date.strip() if search_date else None; effective_search_run_id = search_run_id.strip() if search_run_id else None
         if effective_search_id: conditions.append("sample_id LIKE ?"); params.append(f"%{effective_search_id}%")
         if effective_search_run_id: conditions.append("run_id LIKE ?"); params.append(f"%{effective_search_run_id}%")
         if effective_search_date:
-            try: datetime.strptime(effective_search_date, '%Y-%m-%d'); conditions.append("DATE(timestamp) = ?"); params.append(effective_search_date)
-            except ValueError: messagebox.showerror("Invalid Date", "Use YYYY-MM-DD format.", parent=treeview.winfo_toplevel()); conn.close(); return
+            try: datetime.strptime(effective_search_date, '%Y-%m-%d'); conditions.append("timestamp BETWEEN ? AND ?"); params.extend((f"{effective_search_date} 00:00:00", f"{effective_search_date} 23:59:59")) # Range instead of DATE(timestamp) so idx_timestamp is used
+            except ValueError: messagebox.showerror("Invalid Date", "Use YYYY-MM-DD format.", parent=treeview.winfo_toplevel()); return
+        if after is not None: conditions.append("(timestamp, id) < (?, ?)"); params.extend(after) # Resume strictly after the last row shown
         if conditions: query += " WHERE " + " AND ".join(conditions)
-        query += " ORDER BY timestamp DESC LIMIT 500"; cursor.execute(query, params); rows = cursor.fetchall()
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"; params.append(HISTORY_PAGE_SIZE) # id breaks timestamp ties (batch rows share one) so pages never overlap
+        with _db_lock: rows = get_db().execute(query, params).fetchall()
+        if not rows and after is not None: return None
         if not rows:
              if effective_search_id or effective_search_date or effective_search_run_id: msg = "No records found matching filters."
              else: msg = "No history records found."
              treeview.insert('', tk.END, values=(msg, *[""]*9 ))
         else:
-            for row in rows:
-                 formatted_row = list(row);
-                 for i in [4, 5, 6, 7]:
-                    try: formatted_row[i] = f"{float(formatted_row[i]):.3f}" if formatted_row[i] is not None else ""
-                    except: formatted_row[i] = str(formatted_row[i])
-                 treeview.insert('', tk.END, values=tuple(formatted_row))
+            _treeview_insert_rows(treeview, [(timestamp, operator_id, run_id, sample_id, _format_history_value(nil), _format_history_value(tb1), _format_history_value(tb2), _format_history_value(mit), result, reason) for _row_id, timestamp, operator_id, run_id, sample_id, nil, tb1, tb2, mit, result, reason in rows])
+        return (rows[-1][1], rows[-1][0]) if len(rows) == HISTORY_PAGE_SIZE else None
     except sqlite3.Error as e: messagebox.showerror("Database Error", f"Failed to load history:\n{e}", parent=treeview.winfo_toplevel())
     except Exception as e: traceback.print_exc(); messagebox.showerror("History Error", f"Error loading history:\n{e}", parent=treeview.winfo_toplevel())
-    finally:
-        if conn: conn.close()
 
 # --- History & Log Loading Functions (outside class) ---
 # (load_history function would be here too)
 
-def load_log_data(treeview, search_sample="", search_run="", search_op="", search_date=""):
-    """Loads and filters data from the CSV log file into the log viewer Treeview."""
-    for item in treeview.get_children(): treeview.delete(item)
+def _make_treeview(parent, column_specs, height, heading_anchor=None):
+    """Builds a headings-only Treeview from (id, heading, width, anchor) specs; the last column stretches, headings follow the column anchor unless heading_anchor is given."""
+    tv = ttk.Treeview(parent, columns=[spec[0] for spec in column_specs], show='headings', height=height); last_id = column_specs[-1][0]
+    for col_id, heading, width, anchor in column_specs: tv.heading(col_id, text=heading, anchor=heading_anchor or anchor); tv.column(col_id, width=width, stretch=(tk.YES if col_id == last_id else tk.NO), anchor=anchor)
+    return tv
+
+def _treeview_insert_rows(treeview, rows):
+    """Appends rows (a list of tuples/lists of cell values) to a Treeview with one Tcl call for the whole list, instead of one ttk insert() call per row. Returns the new item ids."""
+    if not treeview.tk.call('info', 'commands', TREEVIEW_INSERT_PROC_NAME): treeview.tk.eval(TREEVIEW_INSERT_PROC)
+    return treeview.tk.splitlist(treeview.tk.call(TREEVIEW_INSERT_PROC_NAME, str(treeview), rows)) # Nested lists become Tcl lists in C, with no per-cell Python quoting
+
+def _treeview_recycle_items(treeview, item_ids, rows, index):
+    """Rebinds existing top-level items to new rows of values and moves them, in order, to index (0 for the top or 'end'), with one Tcl call for the whole list."""
+    if not treeview.tk.call('info', 'commands', TREEVIEW_RECYCLE_PROC_NAME): treeview.tk.eval(TREEVIEW_RECYCLE_PROC)
+    treeview.tk.call(TREEVIEW_RECYCLE_PROC_NAME, str(treeview), item_ids, rows, index)
+
+def _fill_treeview_paged(treeview, scrollbar, rows, to_values=tuple):
+    """Shows rows (a list or any iterable, consumed lazily) in a Treeview through a window of at most TREEVIEW_WINDOW_ROWS items, TREEVIEW_PAGE_SIZE rows at a time:
+    the first page now, the next one once the view nears the end of the window. When the window is full, the page of items at the far end is rebound to the incoming rows and moved
+    (downwards or back up), so the widget's item count stays bounded however far the view is scrolled; the scrollbar spans the window.
+    Takes over the Treeview's yscrollcommand; a later fill (or _reset_treeview_paging) makes this one inert. Returns the number of rows in the first page."""
+    loaded = []; items = deque() # Values of every row read so far (for scrolling back) / the window's item ids, top to bottom
+    state = treeview.paging_state = {'source': iter(rows), 'more': True, 'pending': False, 'start': 0} # start: index in loaded of the window's top row
+    def scroll_down():
+        state['pending'] = False
+        if treeview.paging_state is not state: return 0
+        end = state['start'] + len(items)
+        if end == len(loaded) and state['more']: page = [to_values(row) for row in itertools.islice(state['source'], TREEVIEW_PAGE_SIZE)]; state['more'] = len(page) == TREEVIEW_PAGE_SIZE; loaded.extend(page)
+        page = loaded[end:end + TREEVIEW_PAGE_SIZE]; fit = min(len(page), TREEVIEW_WINDOW_ROWS - len(items))
+        top = float(treeview.yview()[0]) * len(items) if len(page) > fit else 0
+        if fit: items.extend(_treeview_insert_rows(treeview, page[:fit]))
+        if len(page) > fit: # Window full: the top items take the rest of the page at the bottom, and the view moves up with the rows it showed
+            recycled = [items.popleft() for _ in range(len(page) - fit)]; _treeview_recycle_items(treeview, recycled, page[fit:], 'end'); items.extend(recycled); state['start'] += len(recycled)
+            treeview.yview_moveto(max(0.0, top - len(recycled)) / len(items))
+        return len(page)
+    def scroll_up():
+        state['pending'] = False
+        if treeview.paging_state is not state or not state['start']: return
+        count = min(TREEVIEW_PAGE_SIZE, state['start']); start = state['start'] - count; top = float(treeview.yview()[0]) * len(items)
+        recycled = [items.pop() for _ in range(count)][::-1]; _treeview_recycle_items(treeview, recycled, loaded[start:state['start']], 0); items.extendleft(reversed(recycled)); state['start'] = start
+        treeview.yview_moveto((top + count) / len(items))
+    def on_yscroll(first, last):
+        scrollbar.set(first, last)
+        if treeview.paging_state is not state or state['pending']: return
+        if float(last) >= TREEVIEW_PREFETCH and (state['more'] or state['start'] + len(items) < len(loaded)): state['pending'] = True; treeview.after_idle(scroll_down)
+        elif float(first) <= 1 - TREEVIEW_PREFETCH and state['start']: state['pending'] = True; treeview.after_idle(scroll_up)
+    shown = scroll_down(); treeview.configure(yscrollcommand=on_yscroll); return shown
+
+def _reset_treeview_paging(treeview, scrollbar):
+    """Clears a Treeview filled by _fill_treeview_paged and detaches its pending pages."""
+    treeview.paging_state = None; treeview.configure(yscrollcommand=scrollbar.set); treeview.delete(*treeview.get_children())
+
+def _iter_log_rows_reversed(filepath, block_size=LOG_TAIL_BLOCK):
+    """Yields the CSV log's data rows newest first, reading the file backwards one block at a time (the header row is skipped), so the viewer only parses as much of the log as it shows.
+    A newline ends a record only if an even number of quote characters follows it (csv.writer doubles quotes inside quoted fields), so fields spanning several lines stay whole."""
+    position = os.path.getsize(filepath); carry = b''
+    while position > 0:
+        read_size = min(block_size, position); position -= read_size
+        with open(filepath, 'rb') as f: f.seek(position); segments = (f.read(read_size) + carry).split(b'\n') # Reopened per block: the file is not held open between pages
+        boundary = None; quotes = 0 # The buffer always ends on a record boundary; find the leftmost newline that is one too (at the start of the file, the whole buffer is complete)
+        if position == 0: boundary = 0
+        else:
+            for index in range(len(segments) - 1, 0, -1):
+                quotes += segments[index].count(b'"')
+                if not quotes & 1: boundary = index
+        if boundary is None: carry = b'\n'.join(segments); continue # One record spans the whole block
+        carry = b'\n'.join(segments[:boundary]); rows = list(csv.reader(io.StringIO(b'\n'.join(segments[boundary:]).decode('utf-8', errors='replace'), newline='')))
+        if position == 0: rows = rows[1:] # Header row
+        yield from reversed(rows)
+
+def load_log_data(treeview, scrollbar, search_sample="", search_run="", search_op="", search_date=""):
+    """Loads and filters data from the CSV log file into the log viewer Treeview (most recent first; the log is read backwards and paged in as the view scrolls)."""
+    search_date = search_date.strip()
+    if search_date:
+        try: datetime.strptime(search_date, '%Y-%m-%d') # Validated once here; rows are then matched on the timestamp's date prefix
+        except ValueError: messagebox.showerror("Invalid Date", "Use YYYY-MM-DD format.", parent=treeview.winfo_toplevel()); return
+    _reset_treeview_paging(treeview, scrollbar)
     rows_loaded = 0 # Initialize rows_loaded count here
+    flush_log() # Make sure buffered rows are visible to the reader
     try:
         # Check if file exists before trying to open
         if not os.path.exists(LOG_FILENAME):
@@ -1012,40 +1676,24 @@ def load_log_data(treeview, search_sample="", search_run="", search_op="", searc
                  messagebox.showwarning("Log Format Warning", f"Log header/column count mismatch ({len(header) if header else 'None'} found, {len(LOG_HEADER)} expected). Display might be incorrect.", parent=treeview.winfo_toplevel())
                  # Attempt to display anyway? Might be risky if columns shifted.
 
-            filtered_rows = []
-            row_num_debug = 1 # Start counting after header for debug messages
-            for row in reader:
-                row_num_debug += 1
-                # Check column count rigorously for data rows
-                if len(row) != len(LOG_HEADER):
-                    print(f"Warning: Skipping log row {row_num_debug} due to incorrect column count ({len(row)} found, {len(LOG_HEADER)} expected).", file=sys.stderr)
-                    continue # Skip malformed rows
-
-                # Apply filters (case-insensitive for strings)
-                # Unpack based on the 10-column LOG_HEADER order
-                timestamp_str, op_id, run_id, sample_id, nil_val_str, tb1_val_str, tb2_val_str, mit_val_str, result_val, reason_val = row
-
-                match = True
-                if search_sample and search_sample.lower() not in sample_id.lower(): match = False
-                if search_run and search_run.lower() not in run_id.lower(): match = False
-                if search_op and search_op.lower() not in op_id.lower(): match = False
-                if search_date:
-                    try:
-                        # Attempt to parse date part of timestamp
-                        log_date_str = datetime.strptime(timestamp_str.split()[0], '%Y-%m-%d').strftime('%Y-%m-%d')
-                        if log_date_str != search_date: match = False
-                    except (ValueError, IndexError):
-                        # Handle cases where timestamp might be malformed or date parsing fails
-                        print(f"Warning: Could not parse date from log timestamp '{timestamp_str}' for filtering.", file=sys.stderr)
-                        match = False # Treat as non-match if date filter applied and parsing fails
-
-                if match:
-                    filtered_rows.append(row) # Keep matching rows
-
-            # Insert filtered rows (most recent first)
-            for row_data in reversed(filtered_rows): # Show recent logs first
-                 treeview.insert('', tk.END, values=tuple(row_data))
-                 rows_loaded += 1
+            # Filter terms are lowered once, not per row; the date filter compares the timestamp's first 10 characters as text (log_event always writes '%Y-%m-%d %H:%M:%S')
+            sample_term = search_sample.lower(); run_term = search_run.lower(); op_term = search_op.lower(); column_count = len(LOG_HEADER)
+            def matching_rows():
+                for row in _iter_log_rows_reversed(LOG_FILENAME):
+                    # Check column count rigorously for data rows (blank lines parse to [])
+                    if len(row) != column_count:
+                        if row: print(f"Warning: Skipping log row due to incorrect column count ({len(row)} found, {column_count} expected): {row[:1]}", file=sys.stderr)
+                        continue # Skip malformed rows
+
+                    # Apply filters (case-insensitive for strings), by LOG_HEADER column: 0 Timestamp, 1 OperatorID, 2 RunID, 3 SampleID
+                    if sample_term and sample_term not in row[3].lower(): continue
+                    if run_term and run_term not in row[2].lower(): continue
+                    if op_term and op_term not in row[1].lower(): continue
+                    if search_date and row[0][:10] != search_date: continue
+                    yield row
+
+            # Insert matching rows (most recent first) one page at a time; later pages are read from the log as the view scrolls
+            rows_loaded = _fill_treeview_paged(treeview, scrollbar, matching_rows())
 
             if rows_loaded == 0:
                  # Check if filters were applied to distinguish between "no match" and "empty file"